@@ -0,0 +1,111 @@
+################################################################
+# Runs a grid of simulations with different seeds and settings in parallel.
+# Every finished generation is streamed into one JSON lines file. Runs already finished in that file are skipped,
+# so an interrupted batch continues where it stopped. Run "python batch.py --help" for all options.
+################################################################
+import multiprocessing as mp
+import itertools
+import argparse
+import random
+import json
+import os
+import engine
+
+
+def runKey(run):
+    return "seed={seed},criterion={criterion},genomeLength={genomeLength},mutationRate={mutationRate},size={size[0]}x{size[1]}".format(**run)
+
+
+def runGrid(seeds, criteria, genomeLengths, mutationRates, sizes):
+    """Returns one run for every combination of the given settings."""
+    return [{"seed": seed, "criterion": criterion, "genomeLength": genomeLength, "mutationRate": mutationRate, "size": list(size)} for seed, criterion, genomeLength, mutationRate, size in itertools.product(seeds, criteria, genomeLengths, mutationRates, sizes)]
+
+
+def simulateRun(task):
+    """Runs one simulation in a worker process, sending a record for every generation and a final one to "queue"."""
+    run, generations, generationLength, queue = task
+    key = runKey(run)
+    try:
+        # Seeded the same way as "engine.main", so a run can be reproduced from the command line with the same settings.
+        random.seed(run["seed"])
+        criteria = engine.criteriaByName(run["criterion"])
+        simulation = engine.Simulation(run["size"], genomeLength=run["genomeLength"], mutationRate=run["mutationRate"], criteria=criteria, generationLength=generationLength)
+        simulation.listeners.append(lambda simulation, record: queue.put({"run": key, **run, **record, "survivalRate": record["populationAfter"]/record["populationBefore"] if record["populationBefore"] else 0}))
+        for _ in range(generations*generationLength):
+            simulation()
+        queue.put({"run": key, "done": True, "generations": generations})
+    except Exception as error:
+        queue.put({"run": key, "error": repr(error)})
+
+
+def readResults(path):
+    """
+    Returns the finished runs and the (run, generation) pairs already written to "path".
+    A line cut off by a crash is removed so that new records start on a line of their own.
+    """
+    finished, written = set(), set()
+    if not os.path.exists(path):
+        return finished, written
+
+    with open(path, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n")+1)
+            content = content[:content.rfind(b"\n")+1]
+
+    for line in content.decode().splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get("done"):
+            finished.add(record["run"])
+        elif "generation" in record:
+            written.add((record["run"], record["generation"]))
+    return finished, written
+
+
+def runBatch(runs, generations, path, workers=mp.cpu_count(), generationLength=engine.GENERATION_LENGTH):
+    finished, written = readResults(path)
+    # Unfinished runs are repeated from the start, their records are the same again since every run is seeded.
+    runs = [run for run in runs if runKey(run) not in finished]
+    print("{} runs left, {} already finished".format(len(runs), len(finished)))
+    if not runs:
+        return
+
+    with mp.Manager() as manager, mp.Pool(workers) as pool, open(path, "a") as results:
+        queue = manager.Queue()
+        pending = pool.map_async(simulateRun, [(run, generations, generationLength, queue) for run in runs])
+        remaining = len(runs)
+        while remaining:
+            record = queue.get()
+            if "generation" in record and (record["run"], record["generation"]) in written:
+                continue
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+            if "done" in record or "error" in record:
+                remaining -= 1
+                print("Finished" if "done" in record else "Failed ({})".format(record["error"]), record["run"])
+        pending.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs every combination of the given settings and streams per-generation results into one file.")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1])
+    parser.add_argument("--criteria", nargs="+", choices=[name.lower() for name in engine.criteriaNames], default=[engine.criteriaNames[engine.criteriaIDs.index(engine.reproduceCriteria)].lower()])
+    parser.add_argument("--genome-lengths", type=int, nargs="+", default=[engine.GENOME_LENGTH])
+    parser.add_argument("--mutation-rates", type=float, nargs="+", default=[engine.MUTATION_RATE])
+    parser.add_argument("--sizes", nargs="+", default=["{}x{}".format(*engine.SIMULATION_SIZE)], help="Field sizes in the format XxY.")
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--generation-length", type=int, default=engine.GENERATION_LENGTH)
+    parser.add_argument("--workers", type=int, default=mp.cpu_count())
+    parser.add_argument("--output", default="results.jsonl")
+    args = parser.parse_args()
+
+    sizes = [[int(value) for value in size.lower().split("x")] for size in args.sizes]
+    runs = runGrid(args.seeds, args.criteria, args.genome_lengths, args.mutation_rates, sizes)
+    runBatch(runs, args.generations, args.output, args.workers, args.generation_length)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+################################################################
+# Benchmarks of the hot paths, runs without a display.
+# Every benchmark is run for each field size and density, results are written as JSON and can be compared to an earlier run.
+# Run "python benchmark.py --help" for all options, e.g. "python benchmark.py --output new.json --baseline old.json".
+################################################################
+import statistics
+import platform
+import argparse
+import tempfile
+import random
+import json
+import time
+import sys
+import numpy as np
+import brain
+import engine
+
+SIZES = [[50, 50], [150, 150], [500, 500]]
+DENSITIES = [0.1, 0.5, 0.9]
+BRAIN_COUNT = 1000 # Number of brains built and evaluated by the brain benchmarks.
+REPEAT = 5
+THRESHOLD = 1.1 # Benchmarks slower than the baseline by more than this factor are reported as regressions.
+
+
+def measure(run, setup=None, repeat=REPEAT):
+    """Calls "run" with the result of "setup" "repeat" times, only timing "run". Returns the seconds of every call."""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        startTime = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter()-startTime)
+    return times
+
+
+def createSimulation(size, density, seed, criteria=engine.reproduceCriteria, **settings):
+    random.seed(seed)
+    return engine.Simulation(size, population=round(size[0]*size[1]*density), criteria=criteria, **settings)
+
+
+def restorer(simulation):
+    """Returns a function that puts "simulation" back into its current state, so benchmarks that change it start the same way every time. Random streams only depend on the generation and frame, which are restored as well."""
+    # Species IDs change with every new generation, so the genomes are kept instead.
+    positions, genomes, directions = simulation.positions.copy(), simulation.registry.genomes()[simulation.speciesIDs], simulation.directions.copy()
+    motivation, generation, frames = simulation.motivation.copy(), simulation.generation, simulation.frames
+    def restore():
+        simulation.setPopulation(positions, simulation.registry.intern(genomes), directions)
+        simulation.motivation[:] = motivation
+        simulation.generation, simulation.frames = generation, frames
+        return simulation
+    return restore
+
+
+def benchmarkBrainConstruction(size, density, seed, repeat):
+    rng = random.Random(seed)
+    def setup():
+        random.seed(rng.random())
+        return [brain.generateGenome(engine.GENOME_LENGTH) for _ in range(BRAIN_COUNT)]
+    return measure(lambda genomes: [brain.Brain(genome) for genome in genomes], setup, repeat), BRAIN_COUNT
+
+
+def benchmarkGetActiveNode(size, density, seed, repeat):
+    context = brain.BrainContext(size)
+    random.seed(seed)
+    brains = [brain.Brain(brain.generateGenome(engine.GENOME_LENGTH)) for _ in range(BRAIN_COUNT)]
+    inputs = [([random.randrange(size[0]), random.randrange(size[1])], [random.randint(-1, 1), random.randint(-1, 1)]) for _ in range(BRAIN_COUNT)]
+    return measure(lambda _: [organismBrain.getActiveNode(*input, context) for organismBrain, input in zip(brains, inputs)], repeat=repeat), BRAIN_COUNT
+
+
+def tickBenchmark(**settings):
+    def benchmarkTick(size, density, seed, repeat):
+        simulation = createSimulation(size, density, seed, **settings)
+        simulation.generationLength = repeat+1 # No new generation in between.
+        return measure(lambda _: simulation(), repeat=repeat), 1
+    return benchmarkTick
+
+
+def nextGenerationBenchmark(criteria):
+    def benchmarkNextGeneration(size, density, seed, repeat):
+        simulation = createSimulation(size, density, seed, criteria)
+        simulation.listeners.clear()
+        return measure(lambda simulation: simulation.nextGeneration(criteria), restorer(simulation), repeat), 1
+    return benchmarkNextGeneration
+
+
+def benchmarkSave(size, density, seed, repeat):
+    simulation = createSimulation(size, density, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        return measure(lambda _: engine.save(simulation, directory), repeat=repeat), 1
+
+
+def benchmarkLoad(size, density, seed, repeat):
+    simulation = createSimulation(size, density, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = engine.save(simulation, directory)
+        return measure(lambda _: engine.load(fileName), repeat=repeat), 1
+
+
+benchmarks = {
+    "brainConstruction": benchmarkBrainConstruction,
+    "getActiveNode": benchmarkGetActiveNode,
+    "tick": tickBenchmark(),
+    "tickFixedPoint": tickBenchmark(fixedPoint=True),
+    **{"nextGeneration" + name: nextGenerationBenchmark(criteria) for name, criteria in zip(engine.criteriaNames, engine.criteriaIDs)},
+    "save": benchmarkSave,
+    "load": benchmarkLoad
+}
+densityIndependent = ["brainConstruction", "getActiveNode"] # Only run once per size, they don't use a populated field.
+
+
+def resultKey(name, size, density):
+    return "{}/{}x{}".format(name, *size) + ("" if density is None else "/{}".format(density))
+
+
+def runBenchmarks(names, sizes, densities, seed=1, repeat=REPEAT):
+    """Returns a dictionary of results for every combination of benchmark, size and density."""
+    results = {}
+    for name in names:
+        for size in sizes:
+            for density in [None] if name in densityIndependent else densities:
+                times, operations = benchmarks[name](size, density, seed, repeat)
+                results[key := resultKey(name, size, density)] = {
+                    "benchmark": name, "size": list(size), "density": density, "operations": operations, "times": times,
+                    "median": statistics.median(times), "min": min(times)
+                }
+                print("{:<40} {:>10.3f} ms  (min {:.3f} ms, {} per call)".format(key, results[key]["median"]*1000, results[key]["min"]*1000, operations))
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Prints the change of every benchmark that is also in "baseline" and returns the keys of the ones that got slower than "threshold" allows."""
+    regressions = []
+    print("\n{:<40} {:>12} {:>12} {:>8}".format("Benchmark", "Baseline ms", "Current ms", "Ratio"))
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result["median"]/baseline[key]["median"]
+        print("{:<40} {:>12.3f} {:>12.3f} {:>7.2f}x{}".format(key, baseline[key]["median"]*1000, result["median"]*1000, ratio, "  slower" if ratio > threshold else ""))
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the hot paths of the simulation and optionally compares them to an earlier run.")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(benchmarks), default=list(benchmarks))
+    parser.add_argument("--sizes", nargs="+", default=["{}x{}".format(*size) for size in SIZES], help="Field sizes in the format XxY.")
+    parser.add_argument("--densities", type=float, nargs="+", default=DENSITIES, help="Share of the field populated at the start.")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="JSON file to write the results to.")
+    parser.add_argument("--baseline", default=None, help="JSON file of an earlier run to compare to, exits with status 1 if anything got slower.")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    sizes = [[int(value) for value in size.lower().split("x")] for size in args.sizes]
+    results = runBenchmarks(args.benchmarks, sizes, args.densities, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(), "repeat": args.repeat, "seed": args.seed, "results": results}, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        if regressions:
+            print("\n{} benchmarks got slower: {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
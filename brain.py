@@ -1,258 +1,380 @@
 # Classes for brains
+# The node tables and compiled brains don't depend on the field, only the sensory nodes do. They live in a "BrainContext",
+# so simulations of different sizes can share one process and its cache of compiled brains.
+import threading
 import random
 import math
+from collections import OrderedDict
+import numpy as np
 
 
-def init(fieldSize):
-    global Brain, Connection, internalNodeIDs, sensoryNodeIDs, actionNodeIDs
-    class nodeTypes:
-        class Sensory:
-            L_x = 1 # Position x
-            L_y = 2 # Position y
-            Rnd = 3 # Random
-            Bx = 10 # X-Border Distance
-            By = 11 # Y-Border Distance
-        class Action:
-            Mfd = 4 # Move forward
-            Mrv = 5 # Move reverse
-            Mrn = 6 # Move random
-            MRL = 7 # Move right/left (-1, 1)
-            MX = 8 # Move x (-1, 1)
-            MY = 9 # Move y (-1, 1)
-
-
-    class Connection:
-        def __init__(self, source : int, target : int, weight : float):
-            # "source" and "target" are integers taken from the class "nodeTypes" and its subclasses, representing IDs of the nodes.
-            self.source = source
-            self.target = target
-            self.weight = weight
+class nodeTypes:
+    class Sensory:
+        L_x = 1 # Position x
+        L_y = 2 # Position y
+        Rnd = 3 # Random
+        Bx = 10 # X-Border Distance
+        By = 11 # Y-Border Distance
+    class Action:
+        Mfd = 4 # Move forward
+        Mrv = 5 # Move reverse
+        Mrn = 6 # Move random
+        MRL = 7 # Move right/left (-1, 1)
+        MX = 8 # Move x (-1, 1)
+        MY = 9 # Move y (-1, 1)
+
+
+class Connection:
+    def __init__(self, source : int, target : int, weight : float):
+        # "source" and "target" are integers taken from the class "nodeTypes" and its subclasses, representing IDs of the nodes.
+        self.source = source
+        self.target = target
+        self.weight = weight
+    
+    def __repr__(self):
+        return "Connection(Source: {}, Target: {}, weight: {})".format(self.source, self.target, self.weight)
+    
+    def __eq__(self, that):
+        return [self.source, self.target] == [that.source, that.target]
+    
+    def getValue(self, sourceInput):
+        return round(sourceInput * self.weight, 5)
+
+
+class SensoryNode:
+    def __init__(self, nodeType, size=[0, 0]):
+        self.nodeType = nodeType
+        self.size = size
+        self.halfSize = [size[i]/2 for i in range(len(size))]
+    
+    def __call__(self, **kwargs):
+        if self.nodeType in positionRequiredNodes:
+            if (position := kwargs.get("position")) != None:
+                if self.nodeType == nodeTypes.Sensory.Bx:
+                    return round(position[0]/self.halfSize[0] - 1, 3)
+                if self.nodeType == nodeTypes.Sensory.By:
+                    return round(position[1]/self.halfSize[1] - 1, 3)
+                if self.nodeType == nodeTypes.Sensory.L_x:
+                    return round(position[0]/self.size[0], 3)
+                if self.nodeType == nodeTypes.Sensory.L_y:
+                    return round(position[1]/self.size[1], 3)
+        if self.nodeType == nodeTypes.Sensory.Rnd:
+            return round(random.random()*2-1, 3)
+
+
+class ActionNode:
+    def __init__(self, nodeType):
+        self.nodeType = nodeType
+    
+    def __call__(self, **kwargs):
+        if (value := kwargs.get("value")) != None:
+            value = [-1, 1][int(value > 0)]
         
-        def __repr__(self):
-            return "Connection(Source: {}, Target: {}, weight: {})".format(self.source, self.target, self.weight)
+        if self.nodeType in directionRequiredNodes:
+            if (direction := kwargs.get("direction")) != None:
+                if self.nodeType == nodeTypes.Action.Mfd:
+                    return direction
+                if self.nodeType == nodeTypes.Action.Mrv:
+                    return list(direction[i]*(-1) for i in range(len(direction)))
         
-        def __eq__(self, that):
-            return [self.source, self.target] == [that.source, that.target]
+        if self.nodeType == nodeTypes.Action.Mrn:
+            return [random.randint(-1, 1) for _ in range(2)]
         
-        def getValue(self, sourceInput):
-            return round(sourceInput * self.weight, 5)
+        if self.nodeType in valueRequiredNodes:
+            if self.nodeType == nodeTypes.Action.MX:
+                return [value, 0]
+            if self.nodeType == nodeTypes.Action.MY:
+                return [0, value]
+            if self.nodeType == nodeTypes.Action.MRL:
+                if direction != [0, 0]:
+                    rotatedDirection = directionRotations[(directionRotations.index(direction)+1)%len(directionRotations)]
+                    return  [value * i for i in rotatedDirection]
+                return direction
 
 
-    class SensoryNode:
-        def __init__(self, nodeType, size=[0, 0]):
-            self.nodeType = nodeType
-            self.size = size
-            self.halfSize = [size[i]/2 for i in range(len(size))]
-        
-        def __call__(self, **kwargs):
-            if self.nodeType in positionRequiredNodes:
-                if (position := kwargs.get("position")) != None:
-                    if self.nodeType == nodeTypes.Sensory.Bx:
-                        return round(position[0]/self.halfSize[0] - 1, 3)
-                    if self.nodeType == nodeTypes.Sensory.By:
-                        return round(position[1]/self.halfSize[1] - 1, 3)
-                    if self.nodeType == nodeTypes.Sensory.L_x:
-                        return round(position[0]/self.size[0], 3)
-                    if self.nodeType == nodeTypes.Sensory.L_y:
-                        return round(position[1]/self.size[1], 3)
-            if self.nodeType == nodeTypes.Sensory.Rnd:
-                return round(random.random()*2-1, 3)
-
-
-    class ActionNode:
-        def __init__(self, nodeType):
-            self.nodeType = nodeType
+class Brain:
+    def __init__(self, genome, decoded=None, weights=None):
+        # "decoded" and "weights" can be passed if they were already computed for many genomes at once, see "BrainCache.many".
+        self.genome = genome
+        self.connections = self.getConnections(decoded)
+        self.optimizeConnections()
+        self.plans = {} # Evaluation plans with and without internal state, see "getPlan".
+        self.weights = compileWeights([self.genome])[0] if weights is None else weights # Weight matrix used by "population.PopulationBrain".
+    
+    def __repr__(self):
+        return str(self.connections)
+    
+    def __call__(self, position, direction, context=None, state=None):
+        activeNode, value = self.getActiveNode(position, direction, context, state)
+        movement = [0, 0]
+        if activeNode != 0:
+            movement = actionNodes[actionNodeIDs.index(activeNode)](position=position, direction=direction, value=value)
+        return movement
+
+    def getActiveNode(self, position, direction, context=None, state=None):
+        """
+        Evaluates the brain for an organism at "position". "state" holds the outputs of the internal nodes of that organism from its previous tick and is updated in place,
+        connections between internal nodes read from it. Without "state" they are left out, which is the same as all internal nodes having been 0 before.
+        """
+        # Brains are shared between fields of any size, "context" provides the sensory nodes of the field the organism lives on.
+        if (context := context or defaultContext) is None:
+            raise ValueError("Brains can only be evaluated with a BrainContext or after calling \"init\"!")
+        sensors, sensoryEdges, recurrentEdges, internalEdges = self.getPlan(state is not None)
+        inputs = [0.0 for _ in range(len(internalNodeIDs)+len(actionNodeIDs))] # Summed inputs of the internal nodes followed by the action nodes.
+
+        # Every used sensor is read once, so all connections from Rnd see the same value.
+        sensoryOutputs = [0.0 for _ in range(len(sensoryNodeIDs))]
+        for sensor in sensors:
+            sensoryOutputs[sensor] = context.sensoryNodes[sensor](position=position, direction=direction)
+        for source, target, weight in sensoryEdges:
+            inputs[target] += round(sensoryOutputs[source] * weight, 5)
+        for source, target, weight in recurrentEdges:
+            inputs[target] += round(state[source] * weight, 5)
+
+        internalOutputs = [round(math.tanh(inputs[index]), 5) for index in range(len(internalNodeIDs))]
+        if state is not None:
+            state[:] = internalOutputs
+        for source, target, weight in internalEdges:
+            inputs[target] += round(internalOutputs[source] * weight, 5)
+
+        actionOutputs = [round(math.tanh(value), 5) for value in inputs[len(internalNodeIDs):]]
+        activeNodeID = 0
+        if (value := actionOutputs[(probIndex := findMax(actionOutputs, actionSupportsNegativeIndices))]) != 0:
+            activeNodeID = actionNodeIDs[probIndex]
         
-        def __call__(self, **kwargs):
-            if (value := kwargs.get("value")) != None:
-                value = [-1, 1][int(value > 0)]
-            
-            if self.nodeType in directionRequiredNodes:
-                if (direction := kwargs.get("direction")) != None:
-                    if self.nodeType == nodeTypes.Action.Mfd:
-                        return direction
-                    if self.nodeType == nodeTypes.Action.Mrv:
-                        return list(direction[i]*(-1) for i in range(len(direction)))
-            
-            if self.nodeType == nodeTypes.Action.Mrn:
-                return [random.randint(-1, 1) for _ in range(2)]
-            
-            if self.nodeType in valueRequiredNodes:
-                if self.nodeType == nodeTypes.Action.MX:
-                    return [value, 0]
-                if self.nodeType == nodeTypes.Action.MY:
-                    return [0, value]
-                if self.nodeType == nodeTypes.Action.MRL:
-                    if direction != [0, 0]:
-                        rotatedDirection = directionRotations[(directionRotations.index(direction)+1)%len(directionRotations)]
-                        return  [value * i for i in rotatedDirection]
-                    return direction
+        return activeNodeID, value
+
+    def getPlan(self, recurrent=False):
+        """
+        Compiles the connections into flat lists once, so every tick only loops over the connections that can change the result.
+        Returns the used sensors and three lists of (source, target, weight): from sensors, between internal nodes (only if "recurrent") and from internal nodes.
+        Sources index the sensory or internal nodes, targets the inputs of "getActiveNode" with the internal nodes before the action nodes.
+        """
+        if (plan := self.plans.get(recurrent)) is not None:
+            return plan
+        connections = self.liveConnections(recurrent)
+        edge = lambda connection: (
+            sensoryNodeIDs.index(connection.source) if connection.source > 0 else internalNodeIDs.index(connection.source),
+            internalNodeIDs.index(connection.target) if connection.target < 0 else len(internalNodeIDs)+actionNodeIDs.index(connection.target),
+            connection.weight
+        )
+        sensoryEdges = [edge(connection) for connection in connections if connection.source > 0]
+        recurrentEdges = [edge(connection) for connection in connections if connection.source < 0 and connection.target < 0]
+        internalEdges = [edge(connection) for connection in connections if connection.source < 0 and connection.target > 0]
+        plan = self.plans[recurrent] = (sorted({source for source, _, _ in sensoryEdges}), sensoryEdges, recurrentEdges, internalEdges)
+        return plan
 
+    def liveConnections(self, recurrent=False):
+        """
+        Connections that can change which action node is chosen. An internal node only matters if a chain of connections leads from a sensor to it and from it to an action node,
+        chains through other internal nodes only count if "recurrent".
+        """
+        connections = [connection for connection in self.connections if recurrent or connection.source > 0 or connection.target > 0]
+        fed = {connection.target for connection in connections if connection.source > 0 and connection.target < 0} # Internal nodes that can have an output other than 0.
+        useful = {connection.source for connection in connections if connection.source < 0 and connection.target > 0} # Internal nodes whose output reaches an action node.
+        changed = recurrent
+        while changed:
+            changed = False
+            for connection in connections:
+                if connection.source < 0 and connection.target < 0:
+                    if connection.source in fed and connection.target not in fed:
+                        fed.add(connection.target)
+                        changed = True
+                    if connection.target in useful and connection.source not in useful:
+                        useful.add(connection.source)
+                        changed = True
+        return [connection for connection in connections if (connection.source > 0 or connection.source in fed) and (connection.target > 0 or connection.target in useful)]
 
-    class Brain:
-        def __init__(self, genome):
-            self.genome = genome
-            self.connections = self.getConnections()
-            self.optimizeConnections()
+    def getConnections(self, decoded=None):
+        result: list[Connection] = []
+        sourceIDs, targetIDs, weights = decodeGenes(self.genome) if decoded is None else decoded
+        for sourceID, targetID, weight in zip(sourceIDs.tolist(), targetIDs.tolist(), weights.tolist()):
+            result.append(Connection(sourceID, targetID, weight))
+        return result
+
+    def optimizeConnections(self):
+        # Optimize doubled connections by adding their weights and creating one connection with that weight.
+        weights: dict[tuple[int], float] = {} # Maps (sourceID, targetID) pairs to their added up weights, keeps the order in which the pairs first appeared.
+        for connection in self.connections:
+            if (sourceTargetPair := (connection.source, connection.target)) in weights:
+                weights[sourceTargetPair] += connection.weight
+            else:
+                weights[sourceTargetPair] = connection.weight
         
-        def __repr__(self):
-            return str(self.connections)
+        self.connections = [Connection(source, target, weight) for (source, target), weight in weights.items()]
+        # Cancel connections to internal nodes that never reach an action node and from internal nodes that never get an input, including chains between internal nodes.
+        self.connections = self.liveConnections(recurrent=True)
+
+
+def decodeGenes(genes):
+    """
+    Decodes genes with shifts and masks, works on single genomes as well as whole arrays of genomes of any shape.
+    Bit 31 selects the source type, bits 24-30 the source, bit 22 the target type, bits 16-21 the target, bit 14 the sign and bits 0-13 the weight.
+    Returns arrays of source IDs, target IDs and weights with the same shape as "genes".
+    """
+    genes = np.asarray(genes, dtype=np.uint32)
+    sourceInt = (genes >> 24) & 0x7F
+    targetInt = (genes >> 16) & 0x3F
+    sourceIDs = np.where((genes >> 31) & 1, internalNodeArray[sourceInt%len(internalNodeIDs)], sensoryNodeArray[sourceInt%len(sensoryNodeIDs)])
+    targetIDs = np.where((genes >> 22) & 1, internalNodeArray[targetInt%len(internalNodeIDs)], actionNodeArray[targetInt%len(actionNodeIDs)])
+    weights = np.where((genes >> 14) & 1, -1, 1) * np.round((genes & 0x3FFF)/WEIGHT_CONSTANT, 2)
+    return sourceIDs, targetIDs, weights
+
+
+def compileWeights(genomes):
+    """
+    Builds the weight matrices of shape (sensory+internal, internal+action) for an array of genomes with shape (population, genes).
+    Contains the same connections "Brain.getActiveNode" evaluates, doubled connections are added up. Connections between internal nodes
+    are in the rows of the internal nodes and the columns before the action nodes, they are only used with internal state.
+    """
+    genomes = np.asarray(genomes, dtype=np.uint32)
+    genomes = genomes.reshape(len(genomes), -1 if len(genomes) else 0)
+    sourceIDs, targetIDs, weights = decodeGenes(genomes)
+    organismIndices = np.broadcast_to(np.arange(len(genomes))[:, None], genomes.shape)
+    result = np.zeros((len(genomes), len(sensoryNodeIDs)+len(internalNodeIDs), len(internalNodeIDs)+len(actionNodeIDs)))
+    np.add.at(result, (organismIndices, sourceRows[sourceIDs+len(internalNodeIDs)], targetColumns[targetIDs+len(internalNodeIDs)]), weights)
+    return result
+
+
+def findMax(searchList : list, absIndices):
+    """Finds the max value of a list with negative numbers, applying 'abs()' to elements whose index is in 'absIndices'."""
+    iterList = searchList.copy()
+    for index, value in enumerate(iterList):
+        if index in absIndices:
+            iterList[index] = abs(value)
+    maxFoundIndex = iterList.index(min(iterList))
+    for index, val in enumerate(iterList):
+        if val > iterList[maxFoundIndex]:
+            maxFoundIndex = index
+
+    return maxFoundIndex
+
+
+WEIGHT_CONSTANT = 2**12 # Constant by which the weight read from the genome binary number is divided.
+MAX_WEIGHT = 2**14
+
+sensoryNodeIDs = [nodeTypes.Sensory.L_x, nodeTypes.Sensory.L_y, nodeTypes.Sensory.Rnd, nodeTypes.Sensory.Bx, nodeTypes.Sensory.By]
+actionNodeIDs = [nodeTypes.Action.Mfd, nodeTypes.Action.Mrv, nodeTypes.Action.Mrn, nodeTypes.Action.MRL, nodeTypes.Action.MX, nodeTypes.Action.MY]
+actionNodes = [ActionNode(actionNodeIDs[i]) for i in range(len(actionNodeIDs))]
+actionSupportsNegative = [nodeTypes.Action.MRL, nodeTypes.Action.MX, nodeTypes.Action.MY]
+actionSupportsNegativeIndices = [actionNodeIDs.index(i) for i in actionSupportsNegative]
+internalNodeIDs = [-1, -2, -3, -4] # Internal neurons have negative IDs to prevent accidental confusion with the action and sensory nodes if more are added. Also used to distinguish between action and internal nodes in many parts of the code.
+positionRequiredNodes = [nodeTypes.Sensory.L_x, nodeTypes.Sensory.L_y, nodeTypes.Sensory.Bx, nodeTypes.Sensory.By]
+directionRequiredNodes = [nodeTypes.Action.Mfd, nodeTypes.Action.Mrv, nodeTypes.Action.MRL]
+valueRequiredNodes = [nodeTypes.Action.MRL, nodeTypes.Action.MX, nodeTypes.Action.MY] # Nodes that require the value to detrmine whether its negative or positive
+
+sensoryNodeArray, internalNodeArray, actionNodeArray = np.array(sensoryNodeIDs), np.array(internalNodeIDs), np.array(actionNodeIDs)
+# Lookup tables from node ID (offset by the number of internal nodes since their IDs are negative) to the row or column in the matrices built by "compileWeights".
+sourceRows = np.full(max(sensoryNodeIDs+actionNodeIDs)+len(internalNodeIDs)+1, -1)
+sourceRows[np.array(sensoryNodeIDs+internalNodeIDs)+len(internalNodeIDs)] = np.arange(len(sensoryNodeIDs)+len(internalNodeIDs))
+targetColumns = np.full(max(sensoryNodeIDs+actionNodeIDs)+len(internalNodeIDs)+1, -1)
+targetColumns[np.array(internalNodeIDs+actionNodeIDs)+len(internalNodeIDs)] = np.arange(len(internalNodeIDs)+len(actionNodeIDs))
+
+directionRotations = [[1, 0], [1, -1], [0, -1], [-1, -1], [-1, 0], [-1, 1], [0, 1], [1, 1]]
+
+
+class BrainCache:
+    """Least recently used cache mapping genomes to their compiled brains, shared by all organisms with the same genome."""
+    def __init__(self, maxSize=4096):
+        self.maxSize = maxSize
+        self.brains = OrderedDict()
+        self.lock = threading.RLock() # Simulations in different threads can share one cache.
+        self.hits = 0
+        self.misses = 0
+    
+    def __repr__(self):
+        return "BrainCache with {}/{} brains, {} hits, {} misses".format(len(self), self.maxSize, self.hits, self.misses)
+    
+    def __len__(self):
+        return len(self.brains)
+    
+    def __call__(self, genome):
+        key = tuple(genome.tolist() if isinstance(genome, np.ndarray) else genome)
+        with self.lock:
+            if (cached := self.brains.get(key)) is not None:
+                self.brains.move_to_end(key)
+                self.hits += 1
+                return cached
         
-        def __call__(self, position, direction):
-            activeNode, value = self.getActiveNode(position, direction)
-            movement = [0, 0]
-            if activeNode != 0:
-                movement = actionNodes[actionNodeIDs.index(activeNode)](position=position, direction=direction, value=value)
-            return movement
+            self.misses += 1
+            cached = self.brains[key] = Brain(list(key))
+            if len(self.brains) > self.maxSize:
+                self.brains.popitem(last=False)
+            return cached
     
-        def getActiveNode(self, position, direction):
-            actionInputs = [[] for _ in range(len(actionNodeIDs))] # Inputs are in format list[list[int]]
-            internalInputs = [[] for _ in range(len(internalNodeIDs))]
-            
-            # Compute all connections who have their source at a sensory node.
-            for sensoryConnection in self.sensorySourceConnections:
-                sensoryOutput = sensoryConnection.getValue(sensoryNodes[sensoryNodeIDs.index(sensoryConnection.source)](position=position, direction=direction))
-                if sensoryConnection.target > 0: # Target of connection is an action node
-                    actionInputs[actionNodeIDs.index(sensoryConnection.target)].append(sensoryOutput)
-                elif sensoryConnection.target < 0: # Target of connection is an internal node
-                    internalInputs[internalNodeIDs.index(sensoryConnection.target)].append(sensoryOutput)
-            
-            # Compute outputs of internal nodes.
-            internalOutputs = [0 for _ in range(len(internalNodeIDs))]
-            for index, internalInput in enumerate(internalInputs):
-                internalOutputs[index] = hyperbol(internalInput)
-
-            # Add outputs of internal nodes to action node inputs.
-            for actionTargetConnection in self.actionTargetConnections:
-                if actionTargetConnection.source < 0: # Source is an internal node, the wanted.
-                    idIndex = actionNodeIDs.index(actionTargetConnection.target)
-                    actionInputs[idIndex].append(actionTargetConnection.getValue(internalOutputs[internalNodeIDs.index(actionTargetConnection.source)]))
-
-            # Compute outputs of action nodes.
-            actionOutputs = [0 for _ in range(len(actionNodeIDs))]
-            for index, actionInput in enumerate(actionInputs):
-                actionOutputs[index] = hyperbol(actionInput)
-
-            activeNodeID = 0
-            if (value := actionOutputs[(probIndex := findMax(actionOutputs, actionSupportsNegativeIndices))]) != 0:
-                activeNodeID = actionNodeIDs[probIndex]
-            
-            return activeNodeID, value
-
-        def getConnections(self):
-            result: list[Connection] = []
-            for gene in self.genome:
-                binary = bin(gene).replace("0b", "")
-                binary = f'{binary:0>32}' # Fills the space to the left of the string with "0" so that string indices still correspond to the same values even if the most significant digit isnt 1.
-                source = int(binary[0], 2)
-                sourceInt = int(binary[1:8], 2)
-                target = int(binary[9], 2)
-                targetInt = int(binary[10:16], 2)
-                isNegative = int(binary[17])
-                weight = int(binary[18:], 2)
-
-                if source: # Bit at most significant digit is 1, source is from an internal node.
-                    sourceID = internalNodeIDs[sourceInt%len(internalNodeIDs)]
-                else: # Bit at most significant digit is 0, source is from sensory node.
-                    sourceID = sensoryNodeIDs[sourceInt%len(sensoryNodeIDs)]
-                
-                if target: # Bit at 9th position is 1, target of connection is an internal node.
-                    targetID = internalNodeIDs[targetInt%len(internalNodeIDs)]
-                else: # Bit at 9th position is 0, target of connection is an action node.
-                    targetID = actionNodeIDs[targetInt%len(actionNodeIDs)]
-                
-                if (targetID < 0 and sourceID < 0): # Both are internal nodes (not computed for simplicitys sake), therefore doesn't need to be appended to "self.connections".
-                    continue
-                
-                result.append(Connection(sourceID, targetID, (-1 if isNegative else 1) * round((weight/WEIGHT_CONSTANT), 2)))
+    def many(self, genomes):
+        """Returns the brains for a list of genomes, decoding all genomes that aren't cached yet in one go."""
+        keys = [tuple(genome.tolist() if isinstance(genome, np.ndarray) else genome) for genome in genomes]
+        with self.lock:
+            missing = list(dict.fromkeys(key for key in keys if key not in self.brains))
+            if len({len(key) for key in missing}) > 1: # Genomes of different lengths can't be decoded as one array.
+                return [self(key) for key in keys]
+
+            if missing:
+                sourceIDs, targetIDs, weights = decodeGenes(missing)
+                compiledWeights = compileWeights(missing)
+                for index, key in enumerate(missing):
+                    self.brains[key] = Brain(list(key), (sourceIDs[index], targetIDs[index], weights[index]), compiledWeights[index])
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+            result = []
+            for key in keys:
+                result.append(self.brains[key])
+                self.brains.move_to_end(key)
+            while len(self.brains) > self.maxSize:
+                self.brains.popitem(last=False)
             return result
 
-        def optimizeConnections(self):
-            optimizedConnections = self.connections.copy()
-            # Optimize doubled connections by adding their weights and creating one connection with that weight.
-            sourceTargetPairs: list[list[int]] = [] # List containing sources and targets in the folllowing format: (sourceID, targetID)
-            weights: list[int] = [] # Values correspond to list above, adding up the weights per source and target pair.
-            for connection in optimizedConnections:
-                if (sourceTargetPair := (connection.source, connection.target)) in sourceTargetPairs:
-                    weights[sourceTargetPairs.index(sourceTargetPair)] += connection.weight
-                else:
-                    sourceTargetPairs.append(sourceTargetPair)
-                    weights.append(connection.weight)
-            
-            optimizedConnections = [Connection(sourceTargetPairs[i][0], sourceTargetPairs[i][1], weights[i]) for i in range(len(sourceTargetPairs))]
-
-            # Create lists of all connections with either end connected to an internal node.
-            internalNodeSource: list[list[Connection]] = [[] for _ in range(len(internalNodeIDs))]
-            internalNodeTarget: list[list[Connection]] = [[] for _ in range(len(internalNodeIDs))]
-            for i in range(len(internalNodeIDs)):
-                for connection in optimizedConnections:
-                    if connection.source == -(i+1):
-                        internalNodeSource[i].append(connection)
-                    elif connection.target == -(i+1):
-                        internalNodeTarget[i].append(connection)
-            
-            # Cancel connections that lead to an internal node without any connections to an action node.
-            for i, sourceList in enumerate(internalNodeSource):
-                if len(sourceList) == 0:
-                    a = 0
-                    while a < len(optimizedConnections):
-                        if optimizedConnections[a].target == -(i+1):
-                            del optimizedConnections[a]
-                        else:
-                            a += 1
-            
-            # Cancel connections with an internal node as target that has no source connections.
-            for i, targetList in enumerate(internalNodeTarget):
-                if len(targetList) == 0:
-                    a = 0
-                    while a < len(optimizedConnections):
-                        if optimizedConnections[a].source == -(i+1):
-                            del optimizedConnections[a]
-                        else:
-                            a += 1
-
-            # Split connections in two lists, sensory input and internal input, used for calculating move.
-            self.sensorySourceConnections : list[Connection] = [connection for connection in self.connections if connection.source > 0]
-            self.internalInputConnections : list[Connection] = [connection for connection in self.connections if connection.source < 0]
-            # All connections that lead to an action node. No set-theoretic relation to other two lists above.
-            self.actionTargetConnections : list[Connection] = [connection for connection in self.connections if connection.target in actionNodeIDs]
-            self.connections = optimizedConnections
-
-
-    def hyperbol(inputs):
-        """Takes a list of inputs and runs their sum through a hpyerbolic tangent function."""
-        return round(math.tanh(sum(inputs)), 5)
-
-
-    def findMax(searchList : list, absIndices):
-        """Finds the max value of a list with negative numbers, applying 'abs()' to elements whose index is in 'absIndices'."""
-        iterList = searchList.copy()
-        for index, value in enumerate(iterList):
-            if index in absIndices:
-                iterList[index] = abs(value)
-        maxFoundIndex = iterList.index(min(iterList))
-        for index, val in enumerate(iterList):
-            if val > iterList[maxFoundIndex]:
-                maxFoundIndex = index
-
-        return maxFoundIndex
-
-
-    WEIGHT_CONSTANT = 2**12 # Constant by which the weight read from the genome binary number is divided.
-    MAX_WEIGHT = 2**14
-
-    sensoryNodeIDs = [nodeTypes.Sensory.L_x, nodeTypes.Sensory.L_y, nodeTypes.Sensory.Rnd, nodeTypes.Sensory.Bx, nodeTypes.Sensory.By]
-    actionNodeIDs = [nodeTypes.Action.Mfd, nodeTypes.Action.Mrv, nodeTypes.Action.Mrn, nodeTypes.Action.MRL, nodeTypes.Action.MX, nodeTypes.Action.MY]
-    sensoryNodes = [SensoryNode(sensoryNodeIDs[i], size=fieldSize) for i in range(len(sensoryNodeIDs))]
-    actionNodes = [ActionNode(actionNodeIDs[i]) for i in range(len(actionNodeIDs))]
-    actionSupportsNegative = [nodeTypes.Action.MRL, nodeTypes.Action.MX, nodeTypes.Action.MY]
-    actionSupportsNegativeIndices = [actionNodeIDs.index(i) for i in actionSupportsNegative]
-    internalNodeIDs = [-1, -2, -3, -4] # Internal neurons have negative IDs to prevent accidental confusion with the action and sensory nodes if more are added. Also used to distinguish between action and internal nodes in many parts of the code.
-    positionRequiredNodes = [nodeTypes.Sensory.L_x, nodeTypes.Sensory.L_y, nodeTypes.Sensory.Bx, nodeTypes.Sensory.By]
-    directionRequiredNodes = [nodeTypes.Action.Mfd, nodeTypes.Action.Mrv, nodeTypes.Action.MRL]
-    valueRequiredNodes = [nodeTypes.Action.MRL, nodeTypes.Action.MX, nodeTypes.Action.MY] # Nodes that require the value to detrmine whether its negative or positive
-
-    directionRotations = [[1, 0], [1, -1], [0, -1], [-1, -1], [-1, 0], [-1, 1], [0, 1], [1, 1]]
+    def clear(self):
+        with self.lock:
+            self.brains.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class BrainContext:
+    """
+    Everything brains need to run on a field of "fieldSize": the sensory nodes, which scale positions by the size, and the caches shared by the simulations using it.
+    Compiled brains don't depend on the size, so by default every context uses "brainCache" and simulations of any size reuse each other's brains.
+    """
+    def __init__(self, fieldSize, cache=None):
+        self.fieldSize = list(fieldSize)
+        self.sensoryNodes = [SensoryNode(nodeID, size=self.fieldSize) for nodeID in sensoryNodeIDs]
+        self.cache = brainCache if cache is None else cache
+        self.decisionTables = None # "population.DecisionTables" depend on the size, created by the first simulation that uses them.
+
+    def __repr__(self):
+        return "BrainContext for a {}x{} field".format(*self.fieldSize)
+
+    def getBrain(self, genome):
+        return self.cache(genome)
+
+    def getBrains(self, genomes):
+        return self.cache.many(genomes)
+
+    def resized(self, fieldSize):
+        """Context for a field of another size sharing the cache of compiled brains."""
+        return BrainContext(fieldSize, self.cache)
+
+
+brainCache = BrainCache()
+defaultContext = None # Used by brains evaluated without a context, set by "init".
+def init(fieldSize):
+    """Sets the context used when none is passed and returns it, simulations create their own so this is only needed to evaluate single brains."""
+    global defaultContext
+    defaultContext = BrainContext(fieldSize)
+    return defaultContext
+
+
+def getBrain(genome):
+    """Returns the compiled brain for a genome, only building a new "Brain" if it isn't cached yet."""
+    return brainCache(genome)
+
+
+def getBrains(genomes):
+    """Same as "getBrain" for a whole list of genomes."""
+    return brainCache.many(genomes)
 
 
 MAX_GENE_VALUE = 0xFFFFFFFF
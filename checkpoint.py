@@ -0,0 +1,186 @@
+# Binary checkpoint format
+# Layout: magic bytes, format version (uint32), header length (uint32), JSON header, then the raw arrays, each aligned to ALIGNMENT bytes.
+# The header holds the simulation settings plus the type, shape and offset of every array, so a file can be loaded by memory-mapping it.
+import threading
+import queue
+import json
+import struct
+import time
+import os
+from collections import deque
+import numpy as np
+
+EXTENSION = ".evo"
+MAGIC = b"EVOCKPT\0"
+VERSION = 1
+ALIGNMENT = 64
+PREFIX = struct.Struct("<8sII")
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def nextFileID(path):
+    """Returns the number after the highest numbered save file in "path", counting old JSON saves as well."""
+    fileIDs = [int(name) for name, extension in map(os.path.splitext, os.listdir(path)) if name.isdigit() and extension in [".json", EXTENSION]]
+    return max(fileIDs, default=-1) + 1
+
+
+def encode(header, arrays):
+    """
+    Compacts a snapshot taken by "Simulation.snapshot": positions use the smallest fitting type, directions int8, motivation float32
+    and genomes are stored once in a table with an index into it for every organism.
+    """
+    genomeTable, genomeIndices = np.unique(arrays["genomes"], axis=0, return_inverse=True)
+    return header, {
+        "positions": arrays["positions"].astype(np.min_scalar_type(max(header["size"]))),
+        "directions": arrays["directions"].astype(np.int8),
+        "motivation": arrays["motivation"].astype(np.float32),
+        "genomes": genomeTable.astype(np.uint32),
+        "genomeIndices": genomeIndices.reshape(-1).astype(np.uint32),
+        # Internal state of recurrent brains is kept exact, rounding it would change the following frames.
+        **({"internalState": arrays["internalState"].astype(np.float64)} if "internalState" in arrays else {})
+    }
+
+
+def isCheckpoint(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write(path, header: dict, arrays: dict[str, np.ndarray]):
+    """Writes "header" and "arrays" to "path", the header must be serializable to JSON."""
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    # Offsets depend on the length of the header that contains them, so the header is padded to a fixed size first.
+    layout = {name: {"dtype": array.dtype.str, "shape": list(array.shape), "offset": 0} for name, array in arrays.items()}
+    headerSize = align(PREFIX.size + len(json.dumps({**header, "arrays": layout}).encode()) + 32*len(arrays)) - PREFIX.size
+    offset = PREFIX.size + headerSize
+    for name, array in arrays.items():
+        layout[name]["offset"] = offset
+        offset = align(offset + array.nbytes)
+    encodedHeader = json.dumps({**header, "arrays": layout}).encode().ljust(headerSize)
+
+    with open(path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, headerSize))
+        f.write(encodedHeader)
+        for name, array in arrays.items():
+            f.seek(layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(max(offset, PREFIX.size + headerSize))
+
+
+def read(path):
+    """Returns the header and a dictionary of read-only arrays mapped from the file."""
+    with open(path, "rb") as f:
+        magic, version, headerSize = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError("{} is not a checkpoint!".format(path))
+        if version > VERSION:
+            raise ValueError("Checkpoint {} has version {}, only versions up to {} can be read!".format(path, version, VERSION))
+        header: dict = json.loads(f.read(headerSize))
+
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, info in header.pop("arrays").items():
+        dtype = np.dtype(info["dtype"])
+        size = int(np.prod(info["shape"])) * dtype.itemsize
+        arrays[name] = mapped[info["offset"]:info["offset"]+size].view(dtype).reshape(info["shape"])
+    return header, arrays
+
+
+class CheckpointWriter:
+    """
+    Encodes and writes snapshots on a background thread, so saving never holds up the simulation.
+    Files are numbered like "engine.save" does, written to a temporary file first and then renamed, so a checkpoint is either complete or not there at all.
+    Only the newest "keep" files written by the writer are kept, all of them if "keep" is None.
+    """
+    def __init__(self, directory, keep=None, maxQueued=4):
+        self.directory = directory
+        self.keep = keep
+        self.fileID = nextFileID(directory)
+        self.files = deque()
+        self.queue = queue.Queue(maxQueued)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.writeTimes = deque(maxlen=100) # Seconds spent encoding and writing.
+        self.latencies = deque(maxlen=100) # Seconds from taking the snapshot until the file was in place.
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return "CheckpointWriter to {} with {} written and {} queued".format(self.directory, self.written, self.queueDepth)
+
+    @property
+    def queueDepth(self):
+        return self.queue.qsize()
+
+    def submit(self, simulation):
+        """Takes a snapshot of "simulation" and queues it, returns the file name it will be written to or None if the queue was full."""
+        header, arrays = simulation.snapshot()
+        fileName = os.path.join(self.directory, "{}{}".format(self.fileID, EXTENSION))
+        try:
+            self.queue.put_nowait((fileName, header, arrays, time.perf_counter()))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        self.fileID += 1
+        return fileName
+
+    def attach(self, simulation, every):
+        """Writes a checkpoint of "simulation" after every "every" generations."""
+        simulation.listeners.append(lambda simulation, record: simulation.generation % every == 0 and self.submit(simulation))
+
+    def run(self):
+        while (task := self.queue.get()) is not None:
+            fileName, header, arrays, submitTime = task
+            startTime = time.perf_counter()
+            try:
+                write(fileName + ".tmp", *encode(header, arrays))
+                os.replace(fileName + ".tmp", fileName)
+            except Exception as error: # Only this checkpoint is lost, the thread has to stay alive for the following ones.
+                self.failed += 1
+                print("Writing checkpoint {} failed: {!r}".format(fileName, error))
+                if os.path.exists(fileName + ".tmp"):
+                    os.remove(fileName + ".tmp")
+                continue
+            self.files.append(fileName)
+            self.written += 1
+            self.writeTimes.append(time.perf_counter()-startTime)
+            self.latencies.append(time.perf_counter()-submitTime)
+            self.rotate()
+
+    def rotate(self):
+        """Removes the oldest files written until only "keep" are left."""
+        while self.keep is not None and len(self.files) > self.keep:
+            fileName = self.files.popleft()
+            try:
+                os.remove(fileName)
+            except FileNotFoundError: # Already removed by hand.
+                pass
+            except Exception as error:
+                self.failed += 1
+                print("Removing checkpoint {} failed: {!r}".format(fileName, error))
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queueDepth": self.queueDepth,
+            "lastWriteSeconds": self.writeTimes[-1] if self.writeTimes else None,
+            "meanWriteSeconds": sum(self.writeTimes)/len(self.writeTimes) if self.writeTimes else None,
+            "maxLatencySeconds": max(self.latencies) if self.latencies else None
+        }
+
+    def close(self):
+        """Writes everything still queued and stops the thread."""
+        # Waiting for room in a full queue would block forever if the thread stopped.
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
@@ -0,0 +1,600 @@
+################################################################
+# Headless simulation core, usable without pygame.
+# Run "python engine.py --help" to simulate generations from the command line.
+################################################################
+import random
+import functools
+import math
+import brain
+from population import PopulationBrain, FixedPointBrain, DecisionTables
+from occupancy import CellIndex
+from sparse import ChunkedGrid, SparseCellIndex
+from randomness import RandomStreams
+from species import SpeciesRegistry, deepSize
+import checkpoint
+import telemetry
+from profiling import profiler
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+USEBRAINS = True
+SPARSE_FIELD = False # Stores the field in chunks allocated only where organisms are, for very large fields with few organisms, see "sparse.ChunkedGrid".
+USE_DECISION_TABLES = False # Looks up brains shared by many organisms in tables over the field instead of evaluating them, see "population.DecisionTables".
+RECURRENT_BRAINS = False # Internal nodes keep their outputs between frames and connections between them are evaluated, see "brain.Brain.getActiveNode".
+FIXED_POINT_BRAINS = False # Evaluates brains with scaled integers and a tanh table instead of floats, see "population.FixedPointBrain".
+GENOME_LENGTH = 20
+GENERATION_LENGTH = 200 # Numbers of frames before next generation is created.
+MAX_GENE_VALUE = 0xFFFFFFFF
+MUTATION_RATE = 0
+WEIGHT_JITTER_RATE = 0 # Chance of every gene to have its weight shifted slightly, without changing which nodes it connects.
+WEIGHT_JITTER = 0.1 # Largest shift of a jittered weight.
+DUPLICATION_RATE = 0 # Chance of every offspring to have one of its genes copied over another one.
+MUTABLE_BITS = 18 # Only the highest bits are flipped by mutations, the rest only influence the weight and are not significant enough to create interesting mutations.
+SIMULATION_SIZE = [150, 150]
+
+SAVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Saved")
+
+
+class Criteria:
+    class RIGHT:
+        id = 1
+        quote = 0.5
+    class LEFT:
+        id = 2
+        quote = 0.5
+    class UP:
+        id = 3
+        quote = 0.5
+    class DOWN:
+        id = 4
+        quote = 0.5
+    class BORDER:
+        id = 5
+        quote = 0.1
+    class TEMPERATURE:
+        id = 6
+    class CENTER:
+        id = 7
+
+
+criteriaIDs = [Criteria.RIGHT.id, Criteria.LEFT.id, Criteria.UP.id, Criteria.DOWN.id, Criteria.BORDER.id, Criteria.TEMPERATURE.id, Criteria.CENTER.id]
+criteriaQuotes = [Criteria.RIGHT.quote, Criteria.LEFT.quote, Criteria.UP.quote, Criteria.DOWN.quote, Criteria.BORDER.quote]
+criteriaNames = ["Right", "Left", "Up", "Down", "Border", "Temperature", "Center"]
+reproduceCriteria = Criteria.TEMPERATURE.id
+
+selectionBuilders = {} # Criteria id -> function returning the chance to reproduce of the cells at "x", "y" on a field of "size".
+survivalMasks = {} # Compiled masks by criteria id and field size.
+
+
+def selectionMask(criteriaID, name=None):
+    """
+    Registers the decorated function as the mask builder of a criteria, new criteria are added to "criteriaIDs" and "criteriaNames" under "name".
+    Builders get coordinate arrays and have to work with any shape, so they can be evaluated for a whole field or single cells.
+    """
+    def register(builder):
+        if criteriaID not in criteriaIDs:
+            criteriaIDs.append(criteriaID)
+            criteriaNames.append(name or builder.__name__)
+        selectionBuilders[criteriaID] = builder
+        survivalMasks.clear()
+        return builder
+    return register
+
+
+def criteriaByName(name):
+    """Returns the id of the criteria called "name", ignoring case like the "--criterion" option of the command line."""
+    return criteriaIDs[[criteriaName.lower() for criteriaName in criteriaNames].index(name.lower())]
+
+
+def survivalMask(criteria, size):
+    """Returns the chance to reproduce of every cell of a field of "size" as an array, computed once per criteria and size."""
+    if (key := (criteria, tuple(size))) not in survivalMasks:
+        x, y = np.arange(size[0])[:, None], np.arange(size[1])[None, :]
+        survivalMasks[key] = np.clip(np.broadcast_to(selectionBuilders[criteria](x, y, size), tuple(size)).astype(float), 0, 1)
+    return survivalMasks[key]
+
+
+def survivalChances(criteria, size, positions, dense=True):
+    """Chance to reproduce of the cells at "positions", looked up in the mask of the whole field or, if not "dense", computed for these cells only."""
+    if dense:
+        return survivalMask(criteria, size)[positions[:, 0], positions[:, 1]]
+    x, y = positions[:, 0], positions[:, 1]
+    return np.clip(np.broadcast_to(selectionBuilders[criteria](x, y, size), x.shape).astype(float), 0, 1)
+
+
+@selectionMask(Criteria.RIGHT.id)
+def rightMask(x, y, size):
+    return x > Criteria.RIGHT.quote*size[0]
+
+@selectionMask(Criteria.LEFT.id)
+def leftMask(x, y, size):
+    return x < Criteria.LEFT.quote*size[0]
+
+@selectionMask(Criteria.UP.id)
+def upMask(x, y, size):
+    return y < Criteria.UP.quote*size[1]
+
+@selectionMask(Criteria.DOWN.id)
+def downMask(x, y, size):
+    return y > Criteria.DOWN.quote*size[1]
+
+@selectionMask(Criteria.BORDER.id)
+def borderMask(x, y, size):
+    # Organisms within "quote" of the field size from any edge survive.
+    return (x < Criteria.BORDER.quote*size[0]) | (x > (1-Criteria.BORDER.quote)*size[0]-1) | (y < Criteria.BORDER.quote*size[1]) | (y > (1-Criteria.BORDER.quote)*size[1]-1)
+
+@selectionMask(Criteria.TEMPERATURE.id)
+def temperatureMask(x, y, size):
+    return (y/size[1])**2
+
+@selectionMask(Criteria.CENTER.id)
+def centerMask(x, y, size):
+    return (np.cos((2*x/size[0]-1)*0.75*np.pi) + np.cos((2*y/size[1]-1)*0.75*np.pi)) / 2
+
+
+def mutateGenomes(genomes, rng: np.random.Generator, mutationRate=MUTATION_RATE, weightJitterRate=WEIGHT_JITTER_RATE, duplicationRate=DUPLICATION_RATE, genomeLength=GENOME_LENGTH):
+    """
+    Mutates a matrix with one genome per row at once and returns the result as a new uint32 array, "genomeLength" is only used if there are no genomes.
+    Every gene has a chance of "mutationRate" to get one of its highest "MUTABLE_BITS" bits flipped and of "weightJitterRate" to get its weight shifted.
+    With a chance of "duplicationRate" a genome gets one of its genes copied to another position.
+    """
+    genomes = np.array(genomes, dtype=np.uint32)
+    if genomes.ndim != 2:
+        # Without any genomes there is no row to tell their length from.
+        genomes = genomes.reshape(len(genomes), -1 if len(genomes) else genomeLength)
+    if mutationRate:
+        flipped = rng.random(genomes.shape) < mutationRate
+        bits = 31 - rng.integers(0, MUTABLE_BITS, size=genomes.shape, dtype=np.uint32)
+        genomes ^= flipped.astype(np.uint32) << bits
+    if weightJitterRate:
+        # The weight is stored in the lowest 14 bits as a multiple of 1/4096, its sign in bit 14 is left alone.
+        jittered = rng.random(genomes.shape) < weightJitterRate
+        shift = rng.integers(-round(WEIGHT_JITTER*4096), round(WEIGHT_JITTER*4096)+1, size=genomes.shape)
+        weights = np.clip((genomes & 0x3FFF).astype(np.int64) + shift*jittered, 0, 0x3FFF).astype(np.uint32)
+        genomes = (genomes & ~np.uint32(0x3FFF)) | weights
+    if duplicationRate and genomes.shape[1]:
+        rows = np.flatnonzero(rng.random(len(genomes)) < duplicationRate)
+        sources = rng.integers(0, genomes.shape[1], size=len(rows))
+        targets = rng.integers(0, genomes.shape[1], size=len(rows))
+        genomes[rows, targets] = genomes[rows, sources]
+    return genomes
+
+
+def proposeMoves(grid, start, movements, limit):
+    """
+    Returns the cells organisms at "start" end up in when moving by "movements". A step along an axis is undone if the cell it leads to
+    is occupied in "grid", first for the x and then for the y axis, so organisms only ever move to cells that were empty at the start of the frame.
+    """
+    target = np.clip(start + movements, 0, limit)
+    finalX = target[:, 0].copy()
+    blockedX = (finalX != start[:, 0]) & (grid[finalX, start[:, 1]] >= 0)
+    finalX[blockedX] = start[blockedX, 0]
+    finalY = target[:, 1].copy()
+    blockedY = ((finalX != start[:, 0]) | (finalY != start[:, 1])) & (grid[finalX, finalY] >= 0)
+    finalY[blockedY] = start[blockedY, 1]
+    return np.stack([finalX, finalY], axis=1)
+
+
+def resolveClaims(indices, start, final, size):
+    """
+    Returns a mask of the organisms that actually move. If several organisms move to the same cell, the one with the lowest index gets it and the others stay.
+    Only depends on the organisms claiming a cell, which is what lets "tiles" resolve every part of the field separately.
+    """
+    won = (final != start).any(axis=1)
+    movers = np.flatnonzero(won)
+    # Sorting by cell and then by index leaves the winner first in each group.
+    cells = final[movers, 0]*size[1] + final[movers, 1]
+    order = np.lexsort((indices[movers], cells))
+    won[movers[order][1:][cells[order][1:] == cells[order][:-1]]] = False
+    return won
+
+
+class Simulation:
+    def __init__(self, fieldSize : list[int], generation=0, population=None, genomeLength=GENOME_LENGTH, mutationRate=MUTATION_RATE, criteria=reproduceCriteria, generationLength=GENERATION_LENGTH, weightJitterRate=WEIGHT_JITTER_RATE, duplicationRate=DUPLICATION_RATE, seed=None, decisionTables=USE_DECISION_TABLES, sparse=SPARSE_FIELD, recurrent=RECURRENT_BRAINS, fixedPoint=FIXED_POINT_BRAINS, context=None):
+        self.size = fieldSize
+        # Sensory nodes and caches for brains on this field, simulations of the same size can share one "brain.BrainContext" and those of any size its compiled brains.
+        self.context = brain.BrainContext(fieldSize) if context is None else context
+        if list(self.context.fieldSize) != list(fieldSize):
+            raise ValueError("The brain context is for a field of {}x{}, not {}x{}!".format(*self.context.fieldSize, *fieldSize))
+        self.genomeLength = genomeLength
+        self.mutationRate = mutationRate
+        self.weightJitterRate = weightJitterRate
+        self.duplicationRate = duplicationRate
+        self.criteria = criteria
+        self.generationLength = generationLength
+        self.limit = [self.size[0]-1, self.size[1]-1]
+        self.frames = 0
+        self.generation = generation
+        self.listeners = [] # Functions called with (simulation, record) after every new generation, used by the viewer and for logging.
+        self.frameListeners = [] # Functions called with the simulation after the organisms moved in a frame, before a new generation is created.
+        self.timings = {"think": 0.0, "move": 0.0} # Seconds spent in each part of the frames of the current generation.
+        self.generationStart = time.perf_counter()
+        self.seed = random.getrandbits(64) if seed is None else seed # Derived from "random" by default so that seeding it still reproduces a run.
+        self.streams = RandomStreams(self.seed)
+        if decisionTables and self.context.decisionTables is None:
+            self.context.decisionTables = DecisionTables()
+        self.decisionTables = self.context.decisionTables if decisionTables else None
+        self.sparse = sparse
+        self.recurrent = recurrent
+        self.fixedPoint = fixedPoint
+
+        # The field is stored as an occupancy grid holding the index of the organism in each cell or -1, the organisms themselves as arrays indexed the same way.
+        # The sparse grid and cell index only store the occupied cells, so they scale with the number of organisms instead of the area.
+        self.grid = ChunkedGrid(self.size) if sparse else np.full(self.size, -1, dtype=np.int32)
+        self.cellIndex = SparseCellIndex(self.size) if sparse else CellIndex(self.size)
+        self.registry = SpeciesRegistry(functools.partial(createOrganisms, context=self.context), genomeLength) # Every organism only stores the ID of its species, which holds its genome, brain and color.
+        self.setPopulation([], [])
+
+        if not generation:
+            self.initiateColony(round(self.size[0] * self.size[1] / 2) if population is None else population)
+
+    def __repr__(self):
+        return "Simulation with {} organisms on a {}x{} field".format(self.population, *self.size)
+
+    def __call__(self):
+        startTime = time.perf_counter()
+        movements = self.think(self.frameRandomness())
+        thinkTime = time.perf_counter()
+        self.move(movements)
+        moveTime = time.perf_counter()
+        self.timings["think"] += thinkTime-startTime
+        self.timings["move"] += moveTime-thinkTime
+        if profiler.enabled:
+            profiler.record("think", thinkTime-startTime)
+            profiler.record("move", moveTime-thinkTime)
+        self.advance()
+
+    def advance(self):
+        """Counts a finished frame and creates the next generation once the current one is over."""
+        self.frames += 1
+        for listener in self.frameListeners:
+            listener(self)
+        if self.frames >= self.generationLength:
+            self.nextGeneration(self.criteria)
+
+    @property
+    def population(self):
+        return len(self.cellIndex)
+
+    def setPopulation(self, positions, speciesIDs, directions=None):
+        """
+        Replaces all organisms, "speciesIDs" holds the species of every organism as returned by "self.registry.intern".
+        "positions" and "directions" are lists of [x, y] pairs in the same order.
+        """
+        self.speciesIDs = self.registry.setMembers(speciesIDs)
+        self.organisms = self.registry.members(self.speciesIDs) # The species of every organism, "self.organisms[index]" works like a list of organisms.
+        self.positions = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        rng = self.streams.generator("population", self.generation, self.frames)
+        self.directions = rng.integers(-1, 2, size=(len(self.organisms), 2)) if directions is None else np.array(directions, dtype=np.int64).reshape(-1, 2)
+        self.motivation = rng.random(len(self.organisms))+0.5
+        self.alive = np.ones(len(self.organisms), dtype=bool)
+        self.internalState = np.zeros((len(self.organisms), len(brain.internalNodeIDs))) # Outputs of the internal nodes of every organism, only used if "recurrent".
+        self.grid.fill(-1)
+        self.grid[self.positions[:, 0], self.positions[:, 1]] = np.arange(len(self.organisms))
+        self.cellIndex.reset(self.cellIndex.toCells(self.positions))
+        if USEBRAINS:
+            # A table costs about as much as evaluating its brain once for every cell, so it is only built when its organisms would evaluate it more often during a generation.
+            minOrganisms = math.ceil(self.size[0]*self.size[1]/self.generationLength)
+            self.populationBrain = (FixedPointBrain if self.fixedPoint else PopulationBrain).fromBrains([species.brain for species in self.registry.species], self.size, self.speciesIDs, self.decisionTables, minOrganisms)
+
+    def snapshot(self):
+        """
+        Returns a copy of the current state as a header and a dictionary of arrays, cheap enough to be taken between two frames.
+        "checkpoint.encode" turns it into the compact form that is written to disk.
+        """
+        indices = np.flatnonzero(self.alive)
+        header = {"generation": self.generation, "frames": self.frames, "size": list(self.size), "genomeLength": self.genomeLength, "mutationRate": self.mutationRate, "weightJitterRate": self.weightJitterRate, "duplicationRate": self.duplicationRate, "seed": self.seed, "sparse": self.sparse, "recurrent": self.recurrent, "fixedPoint": self.fixedPoint, "criteria": self.criteria, "generationLength": self.generationLength}
+        arrays = {
+            "positions": self.positions[indices],
+            "directions": self.directions[indices],
+            "motivation": self.motivation[indices],
+            "genomes": self.registry.genomes()[self.speciesIDs[indices]]
+        }
+        if self.recurrent:
+            arrays["internalState"] = self.internalState[indices]
+        return header, arrays
+
+    def organismAt(self, position):
+        """Returns the organism at the given cell or None if the cell is empty."""
+        if (index := self.grid[position[0], position[1]]) < 0:
+            return None
+        return self.organisms[index]
+
+    def removeAt(self, position):
+        if (index := self.grid[position[0], position[1]]) >= 0:
+            self.alive[index] = False
+            self.registry.remove(self.speciesIDs[index])
+            self.grid[position[0], position[1]] = -1
+            self.cellIndex.release(self.cellIndex.toCells(position)[0])
+
+    def frameRandomness(self):
+        """Draws all random values organisms need in a frame at once, indexed the same way as "self.organisms". Only depends on the seed, generation and frame."""
+        population = len(self.organisms)
+        return {
+            "motivated": self.streams.generator("motivated", self.generation, self.frames).random(population) < self.motivation,
+            "sensory": self.streams.generator("sensory", self.generation, self.frames).random(population)*2-1,
+            "moves": self.streams.generator("moves", self.generation, self.frames).integers(-1, 2, size=(population, 2))
+        }
+
+    def think(self, randomness):
+        """Batched version of calling every organism, returns an array of movements with the same order as "self.organisms"."""
+        if USEBRAINS:
+            movements = self.populationBrain(self.positions, self.directions, randomness["sensory"], randomness["moves"], self.internalState if self.recurrent else None)
+        else:
+            movements = self.directions.copy()
+        movements[~randomness["motivated"]] = 0
+        return movements
+
+    def move(self, movements):
+        """Moves all living organisms at once, see "proposeMoves" and "resolveClaims"."""
+        indices = np.flatnonzero(self.alive)
+        start = self.positions[indices]
+        final = proposeMoves(self.grid, start, movements[indices], self.limit)
+        self.applyMoves(indices, start, final, resolveClaims(indices, start, final, self.size))
+        self.directions[indices] = movements[indices]
+
+    def applyMoves(self, indices, start, final, won):
+        """Moves the organisms "indices[won]" from "start" to "final" in the grid, the cell index and the position array."""
+        self.grid[start[won, 0], start[won, 1]] = -1
+        self.grid[final[won, 0], final[won, 1]] = indices[won]
+        self.cellIndex.moveMany(self.cellIndex.toCells(start[won]), self.cellIndex.toCells(final[won]))
+        self.positions[indices[won]] = final[won]
+
+    def initiateColony(self, colonySize):
+        if colonySize > self.cellIndex.free:
+            raise ValueError("Colony size too big to initiate on field!")
+
+        rng = self.streams.generator("colony", self.generation, self.frames)
+        positions = np.concatenate((self.positions[self.alive], self.cellIndex.toPositions(self.cellIndex.sampleFree(colonySize, rng))))
+        genomes = rng.integers(0, MAX_GENE_VALUE, size=(colonySize, self.genomeLength), dtype=np.uint32, endpoint=True)
+        speciesIDs = np.concatenate((self.speciesIDs[self.alive], self.registry.intern(genomes)))
+        internalState = self.internalState[self.alive]
+        self.setPopulation(positions, speciesIDs, np.concatenate((self.directions[self.alive], rng.integers(-1, 2, size=(colonySize, 2)))))
+        self.internalState[:len(internalState)] = internalState
+
+    def emigrants(self, amount):
+        """Returns the genomes of up to "amount" randomly chosen living organisms as rows of an array, the organisms themselves stay."""
+        rng = self.streams.generator("emigration", self.generation, self.frames)
+        chosen = rng.choice(indices := np.flatnonzero(self.alive), min(amount, len(indices)), replace=False)
+        return self.registry.genomes()[self.speciesIDs[np.sort(chosen)]]
+
+    def immigrate(self, genomes):
+        """
+        Adds organisms with the given genomes by replacing randomly chosen living organisms in their cells,
+        if there aren't enough organisms the rest are placed on free cells, so extinct populations can be settled again.
+        """
+        genomes = np.asarray(genomes, dtype=np.uint32).reshape(len(genomes), -1)
+        rng = self.streams.generator("immigration", self.generation, self.frames)
+        indices = np.flatnonzero(self.alive)
+        replaced = np.sort(rng.choice(indices, min(len(genomes), len(indices)), replace=False))
+        speciesIDs = self.speciesIDs.copy()
+        speciesIDs[replaced] = self.registry.intern(genomes[:len(replaced)])
+        settled = self.cellIndex.toPositions(self.cellIndex.sampleFree(len(genomes)-len(replaced), rng))
+        motivation = np.concatenate((self.motivation[indices], rng.random(len(settled))+0.5))
+        internalState = self.internalState[indices]
+        internalState[np.searchsorted(indices, replaced)] = 0 # Immigrants start without any state of their own.
+        self.setPopulation(
+            np.concatenate((self.positions[indices], settled)),
+            np.concatenate((speciesIDs[indices], self.registry.intern(genomes[len(replaced):len(replaced)+len(settled)]))),
+            np.concatenate((self.directions[indices], rng.integers(-1, 2, size=(len(settled), 2))))
+        )
+        self.motivation[:] = motivation
+        self.internalState[:len(indices)] = internalState
+
+    def randomOrganism(self, rng=None):
+        """Returns a randomly chosen organism or None if the field is empty. Uses its own generator by default so that viewing doesn't change the run."""
+        if (cell := self.cellIndex.randomOccupied(rng or np.random.default_rng())) is None:
+            return None
+        return self.organisms[self.grid.flat[cell]]
+
+    def generationStats(self):
+        """Statistics of the organisms currently alive: number of distinct genomes and mean number of connections per brain."""
+        counts = self.registry.counts.tolist()
+        connections = sum(count*len(species.brain.connections) for species, count in zip(self.registry.species, counts) if count) if USEBRAINS else 0
+        return {
+            "uniqueGenomes": self.registry.living,
+            "meanConnections": connections/sum(counts) if sum(counts) else 0
+        }
+
+    def memoryStats(self):
+        """
+        Bytes per living organism, with the genome, brain and color shared per species as they are and as an estimate of
+        every organism holding its own genome, color and row of brain weights.
+        """
+        population = max(self.population, 1)
+        arrays = sum(array.nbytes for array in [self.grid, self.positions, self.directions, self.motivation, self.alive] + ([self.internalState] if self.recurrent else []))
+        weights = self.populationBrain.weights.nbytes if USEBRAINS else 0
+        registry = self.registry.nbytes()
+        # Without species every organism had an object of its own with its genome and color, the reference to it and a row of brain weights, only brains were shared.
+        organismBytes = 0
+        if len(self.registry):
+            sample = self.registry[0]
+            organismBytes = deepSize(sample, {id(sample.brain)}) + 8 + weights//len(self.registry)
+        return {
+            "species": len(self.registry),
+            "bytesPerOrganism": (arrays + self.speciesIDs.nbytes + weights + registry)/population,
+            "unsharedBytesPerOrganism": (arrays + registry)/population + organismBytes
+        }
+
+    def nextGeneration(self, criteria):
+        startTime = time.perf_counter()
+        record = {
+            "generation": self.generation,
+            "criteria": criteriaNames[criteriaIDs.index(criteria)],
+            "populationBefore": self.population,
+            **self.generationStats(),
+            "frames": self.frames,
+            "frameSeconds": startTime-self.generationStart,
+            "thinkSeconds": self.timings["think"],
+            "moveSeconds": self.timings["move"]
+        }
+        self.generation += 1
+        self.frames = 0
+        # One draw for all organisms against the chance of the cell they ended up in.
+        indices = np.flatnonzero(self.alive)
+        chances = survivalChances(criteria, self.size, self.positions[indices], not self.sparse)
+        parents = indices[self.streams.generator("selection", self.generation).random(len(indices)) < chances]
+
+        record["parents"] = len(parents)
+        record["survivorRatio"] = len(parents)/record["populationBefore"] if record["populationBefore"] else 0
+        # Every parent gets 1 to 3 offspring placed on distinct random cells of the emptied field, offspring that don't fit anymore are dropped.
+        rng = self.streams.generator("offspring", self.generation)
+        parents = np.repeat(parents, rng.integers(1, 4, size=len(parents)))[:self.cellIndex.area]
+        self.cellIndex.reset()
+        positions = self.cellIndex.toPositions(self.cellIndex.sampleFree(len(parents), rng))
+        speciesIDs = self.speciesIDs[parents]
+        parentGenomes = self.registry.genomes()[speciesIDs]
+        genomes = mutateGenomes(parentGenomes, self.streams.generator("mutation", self.generation), self.mutationRate, self.weightJitterRate, self.duplicationRate, self.genomeLength)
+        # Offspring without mutations belong to the species of their parent, only mutated genomes have to be looked up.
+        mutated = np.flatnonzero((genomes != parentGenomes).any(axis=1))
+        speciesIDs[mutated] = self.registry.intern(genomes[mutated])
+        self.setPopulation(positions, speciesIDs)
+        record["populationAfter"] = self.population
+        record["selectionSeconds"] = time.perf_counter()-startTime
+        profiler.record("nextGeneration", record["selectionSeconds"])
+        self.timings = {name: 0.0 for name in self.timings}
+        self.generationStart = time.perf_counter()
+        for listener in self.listeners:
+            listener(self, record)
+
+
+class Organism:
+    """Shared by all organisms with the same genome, the simulation only creates one per species (see "species.SpeciesRegistry")."""
+    def __init__(self, genome : list[int], organismBrain=None):
+        self.genome = genome
+        if USEBRAINS:
+            self.brain = organismBrain or brain.getBrain(self.genome) # Organisms with the same genome share one compiled brain.
+        else:
+            # Generate a dummy brain in case no neural network is used.
+            self.brain = lambda position, direction: direction
+
+        self.color = self.getColor()
+        for index, val in enumerate(self.color):
+            if not 0 <= val <= 255:
+                self.color[index] = 0
+
+    def __repr__(self):
+        return "Organism with genome {}".format(self.genome)
+
+    def getColor(self):
+        return genomeColor(self.genome)
+
+
+def genomeColor(genome):
+    """Color of an organism, every channel is the mean of every third gene."""
+    colorValue = [[], [], []]
+    for i in range(len(genome)):
+        colorValue[i%3].append(genome[i])
+
+    for index, value in enumerate(colorValue):
+        if len(value) == 0:
+            colorValue[index] = 255
+        else:
+            colorValue[index] = sum(value)/(len(value)*MAX_GENE_VALUE)
+
+    return [value*255 for value in colorValue]
+
+
+def createOrganisms(genomes, context=None):
+    """Creates an organism for every genome, building all brains that aren't in the cache of "context" yet at once."""
+    brains = (brain.getBrains(genomes) if context is None else context.getBrains(genomes)) if USEBRAINS else [None]*len(genomes)
+    return [Organism(genome, organismBrain) for genome, organismBrain in zip(genomes, brains)]
+
+
+def save(simulation: Simulation, path=SAVE_PATH):
+    """Saves the simulation as a binary checkpoint with the next free number in "path" and returns the file name."""
+    fileName = os.path.join(path, "{}{}".format(checkpoint.nextFileID(path), checkpoint.EXTENSION))
+    checkpoint.write(fileName, *checkpoint.encode(*simulation.snapshot()))
+    return fileName
+
+
+def fromSnapshot(header, arrays, **kwargs):
+    """Creates a simulation from the output of "Simulation.snapshot" or "checkpoint.read", keyword arguments override the saved settings."""
+    settings = {name: header[name] for name in ["genomeLength", "mutationRate", "weightJitterRate", "duplicationRate", "criteria", "generationLength", "seed", "sparse", "recurrent", "fixedPoint"] if name in header}
+    simulation = Simulation(header["size"], generation=header["generation"], population=0, **{**settings, **kwargs})
+    speciesIDs = simulation.registry.intern(np.asarray(arrays["genomes"], dtype=np.uint32))
+    simulation.setPopulation(arrays["positions"], speciesIDs[arrays["genomeIndices"]] if "genomeIndices" in arrays else speciesIDs, arrays["directions"])
+    simulation.motivation[:] = arrays["motivation"]
+    if "internalState" in arrays:
+        simulation.internalState[:] = arrays["internalState"]
+    simulation.frames = header["frames"]
+    return simulation
+
+
+def load(path, **kwargs):
+    """Loads a binary checkpoint or an older JSON save, keyword arguments are passed on to "Simulation"."""
+    if checkpoint.isCheckpoint(path):
+        return fromSnapshot(*checkpoint.read(path), **kwargs)
+
+    with open(path, "r") as f:
+        loaded: dict = json.load(f)
+
+    fieldSize = [len(loaded["field"]), len(loaded["field"][0])]
+    positions, genomes, directions = [], [], []
+    for ix, x in enumerate(loaded["field"]):
+        for iy, y in enumerate(x):
+            if y:
+                positions.append([ix, iy])
+                genomes.append(y.get("genome"))
+                directions.append(y.get("direction") or [random.randint(-1, 1) for _ in range(2)])
+
+    simulation = Simulation(fieldSize=fieldSize, generation=loaded.get("generation"), population=0, **kwargs)
+    simulation.setPopulation(positions, simulation.registry.intern(genomes), directions)
+    return simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the simulation without a display as fast as possible.")
+    parser.add_argument("--size", type=int, nargs=2, default=SIMULATION_SIZE, metavar=("X", "Y"), help="Size of the field.")
+    parser.add_argument("--population", type=int, default=None, help="Size of the first generation, defaults to half the field.")
+    parser.add_argument("--genome-length", type=int, default=GENOME_LENGTH)
+    parser.add_argument("--criterion", choices=[name.lower() for name in criteriaNames], default=criteriaNames[criteriaIDs.index(reproduceCriteria)].lower())
+    parser.add_argument("--mutation-rate", type=float, default=MUTATION_RATE)
+    parser.add_argument("--weight-jitter-rate", type=float, default=WEIGHT_JITTER_RATE)
+    parser.add_argument("--duplication-rate", type=float, default=DUPLICATION_RATE)
+    parser.add_argument("--generation-length", type=int, default=GENERATION_LENGTH)
+    parser.add_argument("--generations", type=int, default=10, help="Number of generations to run.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the random generator, chosen randomly if not given.")
+    parser.add_argument("--sparse", action="store_true", default=SPARSE_FIELD, help="Store the field in chunks, for very large fields with few organisms.")
+    parser.add_argument("--recurrent", action="store_true", default=RECURRENT_BRAINS, help="Let internal nodes keep their outputs between frames and feed each other.")
+    parser.add_argument("--fixed-point", action="store_true", default=FIXED_POINT_BRAINS, help="Evaluate brains with scaled integers instead of floats.")
+    parser.add_argument("--decision-tables", action="store_true", default=USE_DECISION_TABLES, help="Look up brains shared by many organisms in precomputed tables.")
+    parser.add_argument("--record", default=None, help="File to record the movements of all organisms to, can be watched with replay.py.")
+    parser.add_argument("--telemetry", default=None, help="File to stream the record of every generation to, CSV if it ends with .csv and JSON lines otherwise.")
+    args = parser.parse_args()
+
+    random.seed(seed := args.seed if args.seed is not None else random.randint(5000, 10_000))
+    print("Seed: {}".format(seed))
+    criteria = criteriaByName(args.criterion)
+    simulation = Simulation(args.size, population=args.population, genomeLength=args.genome_length, mutationRate=args.mutation_rate, criteria=criteria, generationLength=args.generation_length, weightJitterRate=args.weight_jitter_rate, duplicationRate=args.duplication_rate, decisionTables=args.decision_tables, sparse=args.sparse, recurrent=args.recurrent, fixedPoint=args.fixed_point)
+    simulation.listeners.append(lambda simulation, record: print("Generation {generation}: {populationBefore} -> {populationAfter} organisms".format(**record), end=", "))
+    sink = telemetry.TelemetrySink(args.telemetry).attach(simulation) if args.telemetry else None
+    if args.record:
+        import replay # Imported here since it depends on this module.
+    recorder = replay.MoveRecorder(simulation) if args.record else None
+
+    totalSteps = 0
+    startTime = time.perf_counter()
+    for _ in range(args.generations):
+        generationStart = time.perf_counter()
+        for _ in range(simulation.generationLength):
+            simulation()
+        totalSteps += simulation.generationLength
+        print("{:.1f} steps/sec".format(simulation.generationLength/(time.perf_counter()-generationStart)))
+
+    print("Ran {} steps in {:.2f} seconds, {:.1f} steps/sec".format(totalSteps, duration := time.perf_counter()-startTime, totalSteps/duration))
+    memory = simulation.memoryStats()
+    print("{species} species, {bytesPerOrganism:.0f} bytes per organism ({unsharedBytesPerOrganism:.0f} without sharing them)".format(**memory))
+    if recorder:
+        recorder.save(args.record)
+        print("Recorded {} generations to {}".format(len(recorder.generations), args.record))
+    if sink:
+        sink.close()
+        print("Wrote {} records to {}, {:.3f}% of the run time".format(sink.written, sink.path, sink.seconds/duration*100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+################################################################
+# Island model: several simulations evolve in worker processes of their own and regularly exchange some of their genomes.
+# Every island can have its own criterion and mutation rate. After every "interval" generations each island sends copies of "migrants" genomes
+# through a pipe to the next island in a ring, where they replace random organisms. Run "python islands.py --help" for all options.
+################################################################
+import multiprocessing as mp
+import itertools
+import argparse
+import random
+import time
+import numpy as np
+import engine
+import telemetry
+
+MIGRANTS = 10 # Genomes every island sends to the next one per migration.
+MIGRATION_INTERVAL = 5 # Generations between two migrations.
+POLL_SECONDS = 0.1 # How often a waiting model checks whether the island it waits for is still running.
+
+
+def createIsland(island, generationLength):
+    """Creates the simulation of an island, seeded the same way as "engine.main" so an island can be reproduced from the command line."""
+    random.seed(island["seed"])
+    criteria = engine.criteriaByName(island["criterion"])
+    return engine.Simulation(island["size"], population=island.get("population"), genomeLength=island["genomeLength"], mutationRate=island["mutationRate"], criteria=criteria, generationLength=generationLength)
+
+
+def islandWorker(connection, island, generationLength, migrants):
+    """
+    Runs one island in a process of its own and reports when it is ready. Every message is a pair of a number of generations to run and the genomes of the immigrants to take in first,
+    it is answered with the records of the new generations, the genomes of the emigrants and how long simulating and migrating took. None stops the worker.
+    """
+    try:
+        simulation = createIsland(island, generationLength)
+        records = []
+        simulation.listeners.append(lambda simulation, record: records.append(record))
+        connection.send({"ready": True})
+        while (message := connection.recv()) is not None:
+            generations, immigrants = message
+            startTime = time.perf_counter()
+            if len(immigrants):
+                simulation.immigrate(immigrants)
+            simulationStart = time.perf_counter()
+            for _ in range(generations*simulation.generationLength):
+                simulation()
+            simulationEnd = time.perf_counter()
+            emigrants = simulation.emigrants(migrants)
+            connection.send({
+                "records": records,
+                "emigrants": emigrants,
+                "simulationSeconds": simulationEnd-simulationStart,
+                "migrationSeconds": simulationStart-startTime + time.perf_counter()-simulationEnd
+            })
+            records.clear()
+    except Exception as error:
+        connection.send({"error": repr(error)})
+    finally:
+        connection.close()
+
+
+class IslandModel:
+    """
+    Evolves every island of "islands" in its own process, see "islandGrid" for their settings. "listeners" are called with (model, record)
+    for every generation of every island, the record tells which island it came from. All islands need the same genome length.
+    """
+    def __init__(self, islands, migrants=MIGRANTS, interval=MIGRATION_INTERVAL, generationLength=engine.GENERATION_LENGTH):
+        if len({island["genomeLength"] for island in islands}) > 1:
+            raise ValueError("Genomes can only migrate between islands with the same genome length!")
+        self.islands = islands
+        self.migrants = migrants
+        self.interval = interval
+        self.generation = 0
+        self.listeners = []
+        self.epochs = [] # Timings of every round of simulating and migrating.
+        self.connections, self.processes = [], []
+        for island in islands:
+            connection, workerConnection = mp.Pipe()
+            process = mp.Process(target=islandWorker, args=(workerConnection, island, generationLength, migrants), daemon=True)
+            process.start()
+            workerConnection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+        # Creating the islands isn't part of the first round, so its timings only cover simulating and migrating.
+        try:
+            for index in range(len(islands)):
+                self.receive(index)
+        except RuntimeError:
+            self.close()
+            raise
+        self.immigrants = [np.zeros((0, island["genomeLength"]), dtype=np.uint32) for island in islands]
+
+    def __repr__(self):
+        return "IslandModel with {} islands at generation {}".format(len(self.islands), self.generation)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def receive(self, index):
+        """Waits for the next reply of an island, raises a RuntimeError if it reports an error or its process stopped instead of waiting forever."""
+        connection, process = self.connections[index], self.processes[index]
+        try:
+            while not connection.poll(POLL_SECONDS):
+                if not process.is_alive() and not connection.poll():
+                    raise RuntimeError("Island {} stopped with exit code {}".format(index, process.exitcode))
+            reply = connection.recv()
+        except (EOFError, OSError) as error:
+            raise RuntimeError("Island {} stopped: {!r}".format(index, error)) from error
+        if "error" in reply:
+            raise RuntimeError("Island {} failed: {}".format(index, reply["error"]))
+        return reply
+
+    def step(self, generations=None):
+        """Runs all islands for "generations", by default "interval", then sends the emigrants of every island to the next one. Returns the timings of this round."""
+        generations = generations or self.interval
+        startTime = time.perf_counter()
+        for index, (connection, immigrants) in enumerate(zip(self.connections, self.immigrants)):
+            try:
+                connection.send((generations, immigrants))
+            except (BrokenPipeError, OSError) as error:
+                raise RuntimeError("Island {} stopped: {!r}".format(index, error)) from error
+        replies = [self.receive(index) for index in range(len(self.connections))]
+        # Islands form a ring, the emigrants of every island are the immigrants of the next one.
+        self.immigrants = [replies[index-1]["emigrants"] for index in range(len(replies))]
+        wallSeconds = time.perf_counter()-startTime
+
+        self.generation += generations
+        busySeconds = max(reply["simulationSeconds"] + reply["migrationSeconds"] for reply in replies)
+        epoch = {
+            "generation": self.generation,
+            "generations": generations,
+            "wallSeconds": wallSeconds,
+            "simulationSeconds": max(reply["simulationSeconds"] for reply in replies),
+            # Choosing and placing migrants on the slowest island, plus sending everything through the pipes.
+            "migrationSeconds": max(reply["migrationSeconds"] for reply in replies) + wallSeconds-busySeconds,
+            "transferSeconds": wallSeconds-busySeconds,
+            "migrants": sum(len(reply["emigrants"]) for reply in replies)
+        }
+        self.epochs.append(epoch)
+        for index, reply in enumerate(replies):
+            for record in reply["records"]:
+                record = {"island": index, **self.islands[index], **record}
+                for listener in self.listeners:
+                    listener(self, record)
+        return epoch
+
+    def run(self, generations):
+        """Runs "generations" generations on every island, migrating every "interval" generations."""
+        for start in range(0, generations, self.interval):
+            self.step(min(self.interval, generations-start))
+
+    def stats(self):
+        """Totals over all rounds so far, "migrationShare" is the part of the time that went into migration."""
+        wallSeconds = sum(epoch["wallSeconds"] for epoch in self.epochs)
+        migrationSeconds = sum(epoch["migrationSeconds"] for epoch in self.epochs)
+        return {
+            "islands": len(self.islands),
+            "generations": self.generation,
+            "wallSeconds": wallSeconds,
+            "migrationSeconds": migrationSeconds,
+            "migrationShare": migrationSeconds/wallSeconds if wallSeconds else 0,
+            "islandGenerationsPerSecond": len(self.islands)*self.generation/wallSeconds if wallSeconds else 0
+        }
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError): # The worker already stopped after an error.
+                pass
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive(): # Still busy with a round whose reply nobody waits for anymore.
+                process.terminate()
+                process.join()
+        for connection in self.connections:
+            connection.close()
+
+
+def islandGrid(count, seed, criteria, mutationRates, genomeLength, size, population=None):
+    """Settings of "count" islands, criteria and mutation rates are used in turn and every island gets its own seed."""
+    return [
+        {"seed": seed+index, "criterion": criterion, "mutationRate": mutationRate, "genomeLength": genomeLength, "size": list(size), "population": population}
+        for index, criterion, mutationRate in zip(range(count), itertools.cycle(criteria), itertools.cycle(mutationRates))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evolves several islands in parallel processes that regularly exchange genomes.")
+    parser.add_argument("--islands", type=int, default=mp.cpu_count())
+    parser.add_argument("--criteria", nargs="+", choices=[name.lower() for name in engine.criteriaNames], default=[engine.criteriaNames[engine.criteriaIDs.index(engine.reproduceCriteria)].lower()], help="Used by the islands in turn.")
+    parser.add_argument("--mutation-rates", type=float, nargs="+", default=[engine.MUTATION_RATE], help="Used by the islands in turn.")
+    parser.add_argument("--genome-length", type=int, default=engine.GENOME_LENGTH)
+    parser.add_argument("--size", type=int, nargs=2, default=engine.SIMULATION_SIZE, metavar=("X", "Y"), help="Size of the field of every island.")
+    parser.add_argument("--population", type=int, default=None, help="Size of the first generation of every island, defaults to half the field.")
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--generation-length", type=int, default=engine.GENERATION_LENGTH)
+    parser.add_argument("--migrants", type=int, default=MIGRANTS)
+    parser.add_argument("--interval", type=int, default=MIGRATION_INTERVAL, help="Generations between two migrations.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the first island, the others use the following numbers.")
+    parser.add_argument("--output", default=None, help="File to stream the record of every generation of every island to, CSV if it ends with .csv and JSON lines otherwise.")
+    parser.add_argument("--scaling", action="store_true", help="Also run a single island alone and report the speedup of running all islands at once.")
+    args = parser.parse_args()
+
+    islands = islandGrid(args.islands, args.seed, args.criteria, args.mutation_rates, args.genome_length, args.size, args.population)
+    rates = {}
+    for count in ([1] if args.scaling else []) + [len(islands)]:
+        with IslandModel(islands[:count], args.migrants, args.interval, args.generation_length) as model:
+            sink = telemetry.TelemetrySink(args.output) if args.output and count == len(islands) else None
+            if sink:
+                model.listeners.append(sink)
+            for _ in range(0, args.generations, args.interval):
+                epoch = model.step(min(args.interval, args.generations-model.generation))
+                print("{} islands, generation {}: {:.2f} s simulating, {:.3f} s migrating {} genomes".format(count, epoch["generation"], epoch["simulationSeconds"], epoch["migrationSeconds"], epoch["migrants"]))
+            if sink:
+                sink.close()
+            stats = rates[count] = model.stats()
+        print("{islands} islands: {islandGenerationsPerSecond:.2f} island generations/sec, {migrationShare:.1%} of the time spent migrating".format(**stats))
+    if args.scaling:
+        print("Speedup of {} islands over one: {:.2f}".format(len(islands), rates[len(islands)]["islandGenerationsPerSecond"]/rates[1]["islandGenerationsPerSecond"]))
+
+
+if __name__ == "__main__":
+    main()
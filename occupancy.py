@@ -0,0 +1,76 @@
+# Index of the occupied and free cells of a field
+import numpy as np
+
+
+class CellIndex:
+    """
+    Keeps every cell of a field in one array with the occupied cells in front and the free ones behind, plus the slot of each cell in that array.
+    Occupying or freeing a cell swaps it across the border between both parts, which makes updates, counts and random picks take constant time.
+    Cells are stored as flat numbers: x * size[1] + y.
+    """
+    def __init__(self, size, occupied=()):
+        self.size = size
+        self.area = size[0] * size[1]
+        self.reset(occupied)
+
+    def __repr__(self):
+        return "CellIndex with {} occupied and {} free cells".format(self.count, self.free)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def free(self):
+        return self.area - self.count
+
+    def toCells(self, positions):
+        positions = np.asarray(positions).reshape(-1, 2)
+        return positions[:, 0]*self.size[1] + positions[:, 1]
+
+    def toPositions(self, cells):
+        return np.stack(np.divmod(np.asarray(cells), self.size[1]), axis=-1)
+
+    def reset(self, occupied=()):
+        """Rebuilds the index from scratch with the given occupied cells."""
+        occupiedMask = np.zeros(self.area, dtype=bool)
+        occupiedMask[np.asarray(occupied, dtype=np.int64)] = True
+        self.count = int(np.count_nonzero(occupiedMask))
+        self.cells = np.concatenate((np.flatnonzero(occupiedMask), np.flatnonzero(~occupiedMask)))
+        self.slots = np.empty(self.area, dtype=np.int64)
+        self.slots[self.cells] = np.arange(self.area)
+
+    def isOccupied(self, cell):
+        return self.slots[cell] < self.count
+
+    def swap(self, slotA, slotB):
+        cellA, cellB = self.cells[slotA], self.cells[slotB]
+        self.cells[slotA], self.cells[slotB] = cellB, cellA
+        self.slots[cellA], self.slots[cellB] = slotB, slotA
+
+    def occupy(self, cell):
+        if not self.isOccupied(cell):
+            self.swap(self.slots[cell], self.count)
+            self.count += 1
+
+    def release(self, cell):
+        if self.isOccupied(cell):
+            self.count -= 1
+            self.swap(self.slots[cell], self.count)
+
+    def moveMany(self, oldCells, newCells):
+        """Moves occupants from "oldCells" (all occupied) to "newCells" (all free) pairwise, both sides must not contain any cell twice."""
+        oldSlots, newSlots = self.slots[oldCells], self.slots[newCells]
+        self.cells[oldSlots], self.cells[newSlots] = newCells, oldCells
+        self.slots[newCells], self.slots[oldCells] = oldSlots, newSlots
+
+    def sampleFree(self, amount, rng: np.random.Generator):
+        """Returns "amount" distinct random free cells without occupying them, at most as many as there are free cells."""
+        return self.cells[self.count + rng.choice(self.free, min(amount, self.free), replace=False)]
+
+    def randomOccupied(self, rng: np.random.Generator):
+        """Returns a random occupied cell or None if there is none."""
+        return int(self.cells[rng.integers(self.count)]) if self.count else None
+
+    def randomFree(self, rng: np.random.Generator):
+        """Returns a random free cell or None if there is none."""
+        return int(self.cells[self.count + rng.integers(self.free)]) if self.free else None
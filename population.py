@@ -0,0 +1,315 @@
+# Evaluation of all brains of a population at once
+import threading
+import functools
+import random
+import math
+from collections import OrderedDict
+import numpy as np
+import brain
+
+TABLE_BYTES = 512 * 2**20 # Memory all decision tables of a simulation may use together.
+CHUNK_SIZE = 2**16 # Organisms evaluated at once, bounds the memory of the intermediate arrays.
+# Scales of the integers "FixedPointBrain" works with: weights have two decimals (see "brain.decodeGenes"), sensors are rounded to three
+# and connection values and node outputs to five, so every value is an exact integer and no rounding is needed where the scales add up.
+WEIGHT_SCALE = 100
+SENSORY_SCALE = 1000
+VALUE_SCALE = WEIGHT_SCALE*SENSORY_SCALE
+
+
+def hyperbol(inputs):
+    """Runs the already summed up inputs through tanh, rounded to five decimals like "brain.Brain.getActiveNode" does."""
+    return np.round(np.tanh(inputs), 5)
+
+
+@functools.lru_cache(maxsize=8)
+def sensoryTables(size):
+    """
+    Outputs of the position sensors for every coordinate of their axis, by node type as (axis, outputs).
+    Computed by "brain.SensoryNode" itself, rounding them as floats would differ from its "round" where a value ends in an exact 5 in the fourth decimal.
+    """
+    tables = {}
+    for nodeType in brain.positionRequiredNodes:
+        axis = int(nodeType in [brain.nodeTypes.Sensory.L_y, brain.nodeTypes.Sensory.By])
+        node = brain.SensoryNode(nodeType, list(size))
+        tables[nodeType] = axis, np.array([node(position=[coordinate, 0] if axis == 0 else [0, coordinate]) for coordinate in range(size[axis])])
+    return tables
+
+
+tanhTable = None
+def fixedHyperbol(inputs):
+    """Same as "hyperbol" with inputs and outputs scaled by "VALUE_SCALE", tanh is looked up in a table of all inputs up to where it rounds to 1."""
+    global tanhTable
+    if tanhTable is None:
+        limit = math.ceil(math.atanh(1 - 0.5/VALUE_SCALE)*VALUE_SCALE) + 1
+        tanhTable = np.rint(np.round(np.tanh(np.arange(limit)/VALUE_SCALE), 5)*VALUE_SCALE).astype(np.int32)
+    return np.sign(inputs) * tanhTable[np.minimum(np.abs(inputs), len(tanhTable)-1)]
+
+
+class PopulationBrain:
+    sumType = np.float64 # Type of the summed inputs of the nodes.
+
+    def __init__(self, weights, fieldSize, species=None, keys=None, tables=None, minOrganisms=1):
+        """
+        "weights" holds one weight matrix per brain and "species" the index of the brain of every organism, without it every organism has a row of its own.
+        With "tables" and the genome of every brain as "keys", every genome used by at least "minOrganisms" organisms
+        or already in "tables" is looked up in its decision table instead of being evaluated, see "DecisionTables".
+        """
+        self.weights = self.convertWeights(weights) # Shape (brains, sensory+internal, internal+action)
+        self.species = None if species is None else np.asarray(species, dtype=np.int32)
+        self.size = fieldSize
+        self.sensoryCount = len(brain.sensoryNodeIDs)
+        self.internalCount = len(brain.internalNodeIDs)
+        # Rnd is the only sensor that doesn't depend on the position, its inputs are added last so everything before can be precomputed per cell.
+        self.randomSensor = brain.sensoryNodeIDs.index(brain.nodeTypes.Sensory.Rnd)
+        self.positionSensors = [index for index in range(self.sensoryCount) if index != self.randomSensor]
+        self.actionNodeIDs = np.array(brain.actionNodeIDs)
+        self.tableGroups = [] # (organism indices, table) for every genome looked up in a table.
+        self.evaluated = None # Indices of the organisms whose position sums are computed, None for all.
+        self.undecided = None # Indices of the organisms whose brains are evaluated after the position sums, None for all.
+        if tables is not None:
+            species = np.arange(len(self)) if self.species is None else self.species
+            # Organisms sorted by brain, so the organisms of every brain are one slice.
+            order = np.argsort(species, kind="stable")
+            bounds = np.concatenate(([0], np.cumsum(np.bincount(species, minlength=len(self.weights)))))
+            groups = {}
+            for index, key in enumerate(keys):
+                groups.setdefault(key, []).append(index)
+            tabled, decided = np.zeros(len(self.weights), dtype=bool), np.zeros(len(self.weights), dtype=bool)
+            for key, rows in groups.items():
+                if (table := tables.get(key)) is None and sum(bounds[row+1]-bounds[row] for row in rows) >= minOrganisms:
+                    table = tables.build(key, self.weights[rows[0]], self)
+                if table is not None:
+                    self.tableGroups.append((np.sort(np.concatenate([order[bounds[row]:bounds[row+1]] for row in rows])), table))
+                    tabled[rows], decided[rows] = True, table.decided
+            self.evaluated = np.flatnonzero(~tabled[species])
+            # Organisms with a table of decided actions don't need the rest of their brain evaluated either.
+            self.undecided = np.flatnonzero(~decided[species])
+        self.rotations = np.zeros((3, 3, 2), dtype=int) # Maps a direction to the next one in "brain.directionRotations", [0, 0] stays the same.
+        for index, direction in enumerate(brain.directionRotations):
+            self.rotations[direction[0]+1, direction[1]+1] = brain.directionRotations[(index+1)%len(brain.directionRotations)]
+
+    def __repr__(self):
+        return "PopulationBrain with {} brains".format(len(self))
+
+    def __len__(self):
+        return len(self.weights) if self.species is None else len(self.species)
+
+    def convertWeights(self, weights):
+        return np.asarray(weights, dtype=np.float64)
+
+    @classmethod
+    def fromBrains(cls, brains, fieldSize, species=None, tables=None, minOrganisms=1):
+        """"brains" are the distinct brains if "species" is given, otherwise the brain of every organism."""
+        keys = [tuple(organismBrain.genome) for organismBrain in brains] if tables is not None else None
+        return cls(brain.compileWeights([]) if not brains else np.stack([organismBrain.weights for organismBrain in brains]), fieldSize, species, keys, tables, minOrganisms)
+
+    def __call__(self, positions, directions, randomInputs=None, randomMoves=None, state=None):
+        """Returns the movement of every organism, equivalent to calling "Brain.__call__" for each of them."""
+        directions = np.asarray(directions, dtype=int).reshape(-1, 2)
+        activeNodes, values = self.getActiveNodes(positions, randomInputs, state)
+        if randomMoves is None:
+            randomMoves = [[random.randint(-1, 1) for _ in range(2)] for _ in range(len(self))]
+        randomMoves = np.asarray(randomMoves, dtype=int).reshape(-1, 2)
+        signs = np.where(values > 0, 1, -1)
+        nodeTypes = brain.nodeTypes.Action
+
+        movements = np.zeros((len(self), 2), dtype=int)
+        choose = lambda nodeType: (activeNodes == nodeType)[:, None]
+        movements = np.where(choose(nodeTypes.Mfd), directions, movements)
+        movements = np.where(choose(nodeTypes.Mrv), -directions, movements)
+        movements = np.where(choose(nodeTypes.Mrn), randomMoves, movements)
+        movements = np.where(choose(nodeTypes.MRL), self.rotations[directions[:, 0]+1, directions[:, 1]+1]*signs[:, None], movements)
+        movements = np.where(choose(nodeTypes.MX), np.stack([signs, np.zeros_like(signs)], axis=1), movements)
+        movements = np.where(choose(nodeTypes.MY), np.stack([np.zeros_like(signs), signs], axis=1), movements)
+        return movements
+
+    def sense(self, positions, randomInputs=None):
+        """Computes the outputs of all sensory nodes, shape (population, sensory). Rnd is sampled once per organism."""
+        positions = np.asarray(positions, dtype=np.intp).reshape(-1, 2)
+        if randomInputs is None:
+            randomInputs = [random.random()*2-1 for _ in range(len(self))]
+        outputs = np.empty((len(positions), self.sensoryCount))
+        tables = sensoryTables(tuple(self.size))
+        for index, nodeID in enumerate(brain.sensoryNodeIDs):
+            if nodeID in tables:
+                axis, table = tables[nodeID]
+                outputs[:, index] = table[positions[:, axis]]
+            else:
+                outputs[:, index] = np.round(np.asarray(randomInputs, dtype=np.float64), 3)
+        return outputs
+
+    def positionSums(self, sensoryOutputs, weights):
+        """Sums of the inputs of all internal and action nodes that come from sensors depending on the position. Every connection rounds its own value, same as "Connection.getValue"."""
+        return np.round(sensoryOutputs[:, self.positionSensors, None]*weights[:, self.positionSensors, :], 5).sum(axis=1)
+
+    def decide(self, sums, randomOutputs, weights, state=None):
+        """
+        Adds the Rnd inputs to "sums" from "positionSums" and evaluates the rest of the brains, returns the active node IDs, their values and the outputs of the internal nodes.
+        With "state", the internal outputs of the previous tick, connections between internal nodes are evaluated as well.
+        """
+        inputs = sums + np.round(randomOutputs[:, None]*weights[:, self.randomSensor, :], 5)
+        if state is not None:
+            inputs[:, :self.internalCount] += np.round(state[:, :, None]*weights[:, self.sensoryCount:, :self.internalCount], 5).sum(axis=1)
+        internalOutputs = hyperbol(inputs[:, :self.internalCount])
+        actionInputs = inputs[:, self.internalCount:] + np.round(internalOutputs[:, :, None]*weights[:, self.sensoryCount:, self.internalCount:], 5).sum(axis=1)
+        actionOutputs = hyperbol(actionInputs)
+        return *self.choose(actionOutputs), internalOutputs
+
+    def choose(self, actionOutputs):
+        """Returns the active node ID and its value for every row of action outputs."""
+        # Same as "findMax", argmax returns the first of equal maxima.
+        searchOutputs = actionOutputs.copy()
+        searchOutputs[:, brain.actionSupportsNegativeIndices] = np.abs(searchOutputs[:, brain.actionSupportsNegativeIndices])
+        maxIndices = np.argmax(searchOutputs, axis=1) if len(searchOutputs) else np.zeros(0, dtype=int)
+        values = actionOutputs[np.arange(len(actionOutputs)), maxIndices]
+        activeNodes = np.where(values != 0, self.actionNodeIDs[maxIndices], 0)
+        return activeNodes, values
+
+    def memberWeights(self, selection):
+        """Weight matrices of the selected organisms."""
+        return self.weights[selection] if self.species is None else self.weights[self.species[selection]]
+
+    def chunks(self, indices):
+        """Splits the organisms at "indices", all of them for None, into parts of at most "CHUNK_SIZE"."""
+        if indices is None:
+            return [slice(start, min(start+CHUNK_SIZE, len(self))) for start in range(0, len(self), CHUNK_SIZE)]
+        return [indices[start:start+CHUNK_SIZE] for start in range(0, len(indices), CHUNK_SIZE)]
+
+    def getActiveNodes(self, positions, randomInputs=None, state=None):
+        """
+        Equivalent to "Brain.getActiveNode" for the whole population, returns arrays of the active node IDs and their values.
+        "state" holds the internal outputs of every organism from the previous tick and is updated in place, without it connections between internal nodes are left out.
+        """
+        sensoryOutputs = self.sense(positions, randomInputs)
+        activeNodes, values = np.zeros(len(self), dtype=int), np.zeros(len(self))
+        sums = np.zeros((len(self), self.weights.shape[2]), dtype=self.sumType)
+        for selection in self.chunks(self.evaluated):
+            sums[selection] = self.positionSums(sensoryOutputs[selection], self.memberWeights(selection))
+        positions = np.asarray(positions).reshape(-1, 2)
+        for indices, table in self.tableGroups:
+            cells = positions[indices, 0]*self.size[1] + positions[indices, 1]
+            if table.decided:
+                activeNodes[indices], values[indices] = table.activeNodes[cells], table.values[cells]
+            else:
+                sums[indices] = table.sums[cells]
+        for selection in self.chunks(self.undecided):
+            activeNodes[selection], values[selection], internalOutputs = self.decide(sums[selection], sensoryOutputs[selection, self.randomSensor], self.memberWeights(selection), None if state is None else state[selection])
+            if state is not None:
+                state[selection] = internalOutputs
+        return activeNodes, values
+
+
+class FixedPointBrain(PopulationBrain):
+    """
+    Same as "PopulationBrain", but sensors, weights and node outputs are integers scaled by "SENSORY_SCALE", "WEIGHT_SCALE" and "VALUE_SCALE"
+    and tanh is looked up in a table. Chooses the same actions, while its weights take a quarter of the memory. Node outputs can differ by a few units of the
+    last decimal, where the float path's rounding error tips a value over a rounding boundary and that carries on through the internal nodes,
+    so choices only differ between two actions that close to a tie.
+    Differences in the internal state of recurrent brains carry over into the following ticks.
+    Float weights are scaled when it is created, integer ones are taken as already scaled.
+    """
+    sumType = np.int64
+
+    def __init__(self, weights, fieldSize, species=None, keys=None, tables=None, minOrganisms=1):
+        # Its decision tables hold scaled sums, so they are kept apart from the ones of float brains with the same genome.
+        super().__init__(weights, fieldSize, species, None if keys is None else [("fixed",) + key for key in keys], tables, minOrganisms)
+
+    def __repr__(self):
+        return "FixedPointBrain with {} brains".format(len(self))
+
+    def convertWeights(self, weights):
+        weights = np.asarray(weights)
+        if not np.issubdtype(weights.dtype, np.integer):
+            weights = np.rint(weights*WEIGHT_SCALE)
+        # Doubled connections add up, so only very long genomes need more than 16 bits.
+        return weights.astype(np.int16 if np.abs(weights).max(initial=0) <= np.iinfo(np.int16).max else np.int32)
+
+    def sense(self, positions, randomInputs=None):
+        return np.rint(super().sense(positions, randomInputs)*SENSORY_SCALE).astype(np.int32)
+
+    def positionSums(self, sensoryOutputs, weights):
+        # A sensor times a weight is exact at "VALUE_SCALE", same as rounding every connection to five decimals.
+        return (sensoryOutputs[:, self.positionSensors, None]*weights[:, self.positionSensors, :]).sum(axis=1, dtype=np.int64)
+
+    def scaledProducts(self, outputs, weights):
+        """Values of the connections from internal nodes, rounded back to "VALUE_SCALE". Dividing exact integers as floats rounds half to even like "np.round"."""
+        return np.rint(outputs[:, :, None]*weights.astype(np.float64)/WEIGHT_SCALE).astype(np.int64).sum(axis=1)
+
+    def decide(self, sums, randomOutputs, weights, state=None):
+        inputs = sums + randomOutputs[:, None].astype(np.int64)*weights[:, self.randomSensor, :]
+        if state is not None:
+            inputs[:, :self.internalCount] += self.scaledProducts(np.rint(state*VALUE_SCALE), weights[:, self.sensoryCount:, :self.internalCount])
+        internalOutputs = fixedHyperbol(inputs[:, :self.internalCount])
+        actionOutputs = fixedHyperbol(inputs[:, self.internalCount:] + self.scaledProducts(internalOutputs, weights[:, self.sensoryCount:, self.internalCount:]))
+        activeNodes, values = self.choose(actionOutputs)
+        return activeNodes, values/VALUE_SCALE, internalOutputs/VALUE_SCALE
+
+
+class DecisionTable:
+    """
+    Result of one brain for every cell of the field. If neither Rnd nor connections between internal nodes are used, the active node and its value are stored directly,
+    otherwise the input sums from all other sensors, so only the Rnd inputs and the rest of the brain have to be evaluated.
+    """
+    def __init__(self, weights, populationBrain: PopulationBrain):
+        weights = weights[None]
+        size = populationBrain.size
+        cells = np.stack(np.divmod(np.arange(size[0]*size[1]), size[1]), axis=1)
+        sensoryOutputs = populationBrain.sense(cells, np.zeros(len(cells)))
+        sums = populationBrain.positionSums(sensoryOutputs, weights)
+        # Internal state makes the result depend on more than the cell, tables of such brains are the same with or without it.
+        self.decided = not weights[0, populationBrain.randomSensor].any() and not weights[0, populationBrain.sensoryCount:, :populationBrain.internalCount].any()
+        if self.decided:
+            self.activeNodes, self.values, _ = populationBrain.decide(sums, sensoryOutputs[:, populationBrain.randomSensor], weights)
+            self.activeNodes = self.activeNodes.astype(np.int8)
+            self.nbytes = self.activeNodes.nbytes + self.values.nbytes
+        else:
+            self.sums = sums
+            self.nbytes = sums.nbytes
+
+    def __repr__(self):
+        return "DecisionTable ({}) of {} bytes".format("decided" if self.decided else "partial sums", self.nbytes)
+
+
+class DecisionTables:
+    """Least recently used cache of decision tables by genome, together using at most "maxBytes" of memory. Only valid for one field size."""
+    def __init__(self, maxBytes=TABLE_BYTES):
+        self.maxBytes = maxBytes
+        self.tables = OrderedDict()
+        self.lock = threading.RLock() # Simulations in different threads can share the tables of one "brain.BrainContext".
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return "DecisionTables with {} tables, {} bytes, {} hits, {} misses".format(len(self), self.bytes, self.hits, self.misses)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def get(self, key):
+        with self.lock:
+            if (table := self.tables.get(key)) is not None:
+                self.tables.move_to_end(key)
+                self.hits += 1
+            return table
+
+    def build(self, key, weights, populationBrain: PopulationBrain):
+        """Compiles and stores the table of a brain, returns None if it is larger than the whole cache."""
+        table = DecisionTable(weights, populationBrain) # Built outside of the lock, it takes as long as evaluating the brain on every cell.
+        if table.nbytes > self.maxBytes:
+            return None
+        with self.lock:
+            if (existing := self.tables.get(key)) is not None: # Another thread built it in the meantime.
+                self.tables.move_to_end(key)
+                return existing
+            self.misses += 1
+            self.tables[key] = table
+            self.bytes += table.nbytes
+            while self.bytes > self.maxBytes:
+                self.bytes -= self.tables.popitem(last=False)[1].nbytes
+            return table
+
+    def clear(self):
+        with self.lock:
+            self.tables.clear()
+            self.bytes = 0
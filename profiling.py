@@ -0,0 +1,107 @@
+# Timers for the phases of a frame and cProfile captures
+# Disabled by default, timing a phase then only costs a call and an attribute lookup.
+from contextlib import nullcontext
+from collections import deque
+import threading
+import cProfile
+import pstats
+import time
+
+WINDOW = 100 # Number of calls the rolling statistics of a phase are computed over.
+disabledPhase = nullcontext() # Returned for every phase while disabled, so nothing has to be created.
+
+
+class PhaseTimer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, time.perf_counter()-self.startTime)
+
+
+class Profiler:
+    """
+    Keeps the duration of the last "window" calls and the total number of calls for every phase.
+    Phases are timed with "with profiler.phase(name):" or by passing a measured duration to "record".
+    The engine records from its own thread while the viewer reads the statistics, so both go through a lock.
+    """
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.durations: dict[str, deque] = {}
+        self.calls: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.captures = {} # Running cProfile captures by the thread they record, see "startCapture".
+        self.stopped = [] # Captures of the threads that already stopped while others still run.
+
+    def __repr__(self):
+        return "Profiler ({}) with {} phases".format("enabled" if self.enabled else "disabled", len(self.calls))
+
+    def phase(self, name):
+        return PhaseTimer(self, name) if self.enabled else disabledPhase
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            if name not in self.durations:
+                self.durations[name] = deque(maxlen=self.window)
+                self.calls[name] = 0
+            self.durations[name].append(seconds)
+            self.calls[name] += 1
+
+    def stats(self):
+        """Returns the number of calls and the last, mean and longest duration in seconds of every phase over the rolling window."""
+        with self.lock:
+            return {name: {
+                "calls": self.calls[name],
+                "last": durations[-1],
+                "mean": sum(durations)/len(durations),
+                "max": max(durations)
+            } for name, durations in self.durations.items() if durations}
+
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+            self.calls.clear()
+
+    @property
+    def capturing(self):
+        return bool(self.captures)
+
+    def startCapture(self):
+        """
+        Starts recording every function call of the calling thread with cProfile until it calls "stopCapture".
+        cProfile only sees the thread it was enabled in, so every thread to be recorded, like the one of a "runner.SimulationRunner", calls this itself.
+        """
+        with self.lock:
+            if threading.get_ident() in self.captures:
+                return
+            capture = self.captures[threading.get_ident()] = cProfile.Profile()
+        capture.enable()
+
+    def stopCapture(self, path=None, lines=20):
+        """
+        Stops the capture of the calling thread. Once the last thread stopped, prints the functions taking the most time over all threads
+        and saves the merged capture to "path" for tools like snakeviz, returns None before that.
+        """
+        with self.lock:
+            if (capture := self.captures.pop(threading.get_ident(), None)) is None:
+                return None
+            capture.disable()
+            self.stopped.append(capture)
+            if self.captures:
+                return None
+            captures, self.stopped = self.stopped, []
+        stats = pstats.Stats(*captures).sort_stats(pstats.SortKey.CUMULATIVE)
+        if path:
+            stats.dump_stats(path)
+        stats.print_stats(lines)
+        return stats
+
+
+profiler = Profiler() # Shared by the engine and the viewer.
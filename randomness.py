@@ -0,0 +1,31 @@
+# Independent random streams of a simulation
+# Every stream is a Philox generator, a counter-based generator whose output only depends on its key and counter. The key holds the seed
+# and what the numbers are for, the counter the generation and frame. Numbers drawn for a frame therefore don't depend on anything drawn before,
+# so the same run gives the same results whatever order frames, tiles or organisms are computed in.
+import numpy as np
+
+PURPOSES = {name: index for index, name in enumerate([
+    "motivated", # Whether an organism moves in a frame.
+    "sensory", # Input of the random sensory node.
+    "moves", # Direction of the random movement action.
+    "population", # Directions and motivation of new organisms.
+    "colony", # Placement and genomes of a new colony.
+    "selection", # Which organisms reproduce.
+    "offspring", # Number and placement of offspring.
+    "mutation",
+    "emigration", # Which organisms are copied to other islands, see "islands".
+    "immigration" # Which organisms are replaced by immigrants and where the rest are placed.
+])}
+
+
+class RandomStreams:
+    def __init__(self, seed):
+        self.seed = seed
+
+    def __repr__(self):
+        return "RandomStreams with seed {}".format(self.seed)
+
+    def generator(self, purpose, generation=0, frame=0) -> np.random.Generator:
+        """Returns the generator for "purpose" in the given frame, the values it produces are the same every time it is created."""
+        return np.random.Generator(np.random.Philox(key=(self.seed << 8) | PURPOSES[purpose], counter=[0, frame, generation, 0]))
+
@@ -0,0 +1,69 @@
+# Draws the field of a simulation into a pygame surface
+# Keeps the pixels of the field in a surface of its own and only rewrites the cells whose occupant changed since the last draw,
+# the screen is then updated with a single blit. Only the cells inside the viewport are read, so fields of any size can be drawn.
+import pygame as pg
+import numpy as np
+
+BACKGROUND_COLOR = (255, 255, 255)
+OUTLINE_COLOR = (0, 0, 0)
+
+
+class FieldRenderer:
+    """
+    Renders the field with every cell "cellDimensions" pixels large, empty cells are drawn with an outline and occupied ones filled with the color of their organism.
+    Calling it draws "simulation" to "screen" at "position" and returns the number of cells that had to be redrawn.
+    "viewport" is the part of the field that is drawn as [x, y, width, height] in cells, the whole field by default.
+    """
+    def __init__(self, size, cellDimensions, position=(0, 0), viewport=None):
+        self.size = size
+        self.cellDimensions = list(cellDimensions)
+        self.position = list(position)
+        self.viewport = list(viewport or [0, 0, *size])
+        self.surface = pg.Surface((self.viewport[2]*cellDimensions[0], self.viewport[3]*cellDimensions[1]))
+        # Pixel offsets inside a cell and the look of an empty cell, shared by all cells since they have the same size.
+        self.offsets = np.ix_(np.arange(cellDimensions[0]), np.arange(cellDimensions[1]))
+        self.emptyCell = np.empty((*cellDimensions, 3), dtype=np.uint8)
+        self.emptyCell[...] = OUTLINE_COLOR
+        self.emptyCell[1:-1, 1:-1] = BACKGROUND_COLOR
+        self.grid = None
+        self.organisms = None
+        self.colors = None
+
+    def __repr__(self):
+        return "FieldRenderer for a {}x{} field".format(*self.size)
+
+    @property
+    def rect(self):
+        return pg.Rect(self.position, self.surface.get_size())
+
+    def moveViewport(self, x, y):
+        """Moves the top left corner of the viewport to the cell at "x", "y", keeping it inside the field."""
+        self.viewport[:2] = [min(max(x, 0), self.size[0]-self.viewport[2]), min(max(y, 0), self.size[1]-self.viewport[3])]
+        self.grid = None
+
+    def __call__(self, screen: pg.Surface, simulation):
+        if simulation.organisms is not self.organisms:
+            # A new population reuses the organism indices, so every cell has to be drawn again.
+            self.organisms = simulation.organisms
+            self.colors = np.array([organism.color for organism in self.organisms], dtype=np.uint8).reshape(-1, 3)
+            self.grid = None
+        x, y, width, height = self.viewport
+        view = np.asarray(simulation.grid[x:x+width, y:y+height])
+        dirty = np.flatnonzero(view != self.grid) if self.grid is not None else np.arange(view.size)
+        if len(dirty):
+            self.drawCells(dirty, view.flat[dirty])
+            self.grid = view.copy()
+        screen.blit(self.surface, self.position)
+        return len(dirty)
+
+    def drawCells(self, cells, occupants):
+        """Writes the pixels of the given flat cells of the viewport, "occupants" holds the organism index of each cell or -1."""
+        xCoords, yCoords = np.divmod(cells, self.viewport[3])
+        pixelX = (xCoords*self.cellDimensions[0])[:, None, None] + self.offsets[0]
+        pixelY = (yCoords*self.cellDimensions[1])[:, None, None] + self.offsets[1]
+        cellPixels = np.broadcast_to(self.emptyCell, (len(cells), *self.emptyCell.shape)).copy()
+        occupied = occupants >= 0
+        cellPixels[occupied] = self.colors[occupants[occupied]][:, None, None]
+        pixels = pg.surfarray.pixels3d(self.surface)
+        pixels[pixelX, pixelY] = cellPixels
+        del pixels # Unlocks the surface so it can be blitted.
@@ -0,0 +1,281 @@
+################################################################
+# Records the movements of a simulation and plays them back without evaluating any brain.
+# Every frame is stored as one byte per organism holding its step, every generation as a table of genomes and the starting positions.
+# Keyframes with all positions are stored every few frames so any frame can be reached quickly, forward or backward.
+# Run "python replay.py <file>" to watch a recording.
+################################################################
+import argparse
+import json
+import numpy as np
+import engine
+
+KEYFRAME_EVERY = 50
+EXTENSION = ".evr"
+STAYED = 4
+REMOVED = 9 # Code of an organism that was removed in a frame, codes 0 to 8 are steps.
+STEPS = np.array([[code//3 - 1, code%3 - 1] for code in range(9)] + [[0, 0]], dtype=np.int8) # Step of every code.
+
+
+def encodeSteps(previous, current, removed):
+    """Packs the step of every organism from "previous" to "current" positions into one byte, (dx+1)*3 + (dy+1)."""
+    steps = current - previous
+    codes = ((steps[:, 0]+1)*3 + steps[:, 1]+1).astype(np.uint8)
+    codes[removed] = REMOVED
+    return codes
+
+
+def decodeSteps(codes):
+    """
+    Decodes one or more frames of codes, the first axis being the frames.
+    Returns the organisms that moved or were removed, their summed steps and whether they were removed.
+    """
+    codes = np.asarray(codes).reshape(-1, codes.shape[-1])
+    if len(codes) == 1:
+        changed = np.flatnonzero(codes[0] != STAYED)
+        codes = codes[0, changed]
+        return changed, STEPS[codes].astype(np.int64), codes == REMOVED
+    steps = STEPS[codes].sum(axis=0, dtype=np.int64)
+    removed = (codes == REMOVED).any(axis=0)
+    changed = np.flatnonzero(steps.any(axis=1) | removed)
+    return changed, steps[changed], removed[changed]
+
+
+class GenerationRecord:
+    """Movements of one generation: starting state, genome table, one row of step codes per frame and keyframes."""
+    def __init__(self, generation, startFrame, positions, alive, genomes, genomeIndices):
+        self.generation = generation
+        self.startFrame = startFrame
+        self.positions = positions
+        self.alive = alive
+        self.genomes = genomes
+        self.genomeIndices = genomeIndices
+        self.steps = []
+        self.keyframes = {} # Frame -> (positions, alive) after that frame.
+
+    def __repr__(self):
+        return "GenerationRecord of generation {} with {} frames".format(self.generation, self.frames)
+
+    @property
+    def frames(self):
+        return self.startFrame + len(self.steps)
+
+    def toArrays(self):
+        keyframes = sorted(self.keyframes)
+        return {
+            "positions": self.positions,
+            "alive": self.alive,
+            "genomes": self.genomes,
+            "genomeIndices": self.genomeIndices,
+            "steps": np.array(self.steps, dtype=np.uint8).reshape(len(self.steps), len(self.positions)),
+            "keyframes": np.array(keyframes, dtype=np.int64),
+            "keyframePositions": np.array([self.keyframes[frame][0] for frame in keyframes], dtype=self.positions.dtype).reshape(len(keyframes), len(self.positions), 2),
+            "keyframeAlive": np.array([self.keyframes[frame][1] for frame in keyframes], dtype=bool).reshape(len(keyframes), len(self.positions))
+        }
+
+    @classmethod
+    def fromArrays(cls, generation, startFrame, arrays):
+        record = cls(generation, startFrame, arrays["positions"], arrays["alive"], arrays["genomes"], arrays["genomeIndices"])
+        record.steps = list(arrays["steps"])
+        record.keyframes = {int(frame): (positions, alive) for frame, positions, alive in zip(arrays["keyframes"], arrays["keyframePositions"], arrays["keyframeAlive"])}
+        return record
+
+
+class MoveRecorder:
+    """Records every frame of "simulation" from now on, attached as a frame and generation listener."""
+    def __init__(self, simulation, keyframeEvery=KEYFRAME_EVERY):
+        self.size = list(simulation.size)
+        self.positionType = np.min_scalar_type(max(self.size)) # Same as "checkpoint.encode", large enough for any position on the field.
+        self.keyframeEvery = keyframeEvery
+        self.generations: list[GenerationRecord] = []
+        self.startGeneration(simulation)
+        simulation.frameListeners.append(self.recordFrame)
+        simulation.listeners.append(lambda simulation, record: self.startGeneration(simulation))
+
+    def __repr__(self):
+        return "MoveRecorder with {} generations".format(len(self.generations))
+
+    def startGeneration(self, simulation):
+        # The species of the simulation already are a table of distinct genomes.
+        self.generations.append(GenerationRecord(simulation.generation, simulation.frames, simulation.positions.astype(self.positionType), simulation.alive.copy(), simulation.registry.genomes().copy(), simulation.speciesIDs.copy()))
+        self.lastPositions = simulation.positions.copy()
+        self.lastAlive = simulation.alive.copy()
+
+    def recordFrame(self, simulation):
+        current = self.generations[-1]
+        current.steps.append(encodeSteps(self.lastPositions, simulation.positions, self.lastAlive & ~simulation.alive))
+        np.copyto(self.lastPositions, simulation.positions)
+        np.copyto(self.lastAlive, simulation.alive)
+        if simulation.frames % self.keyframeEvery == 0:
+            current.keyframes[simulation.frames] = (simulation.positions.astype(self.positionType), simulation.alive.copy())
+
+    def save(self, path):
+        """Writes the recording to "path", compressed with zlib."""
+        header = {"size": self.size, "keyframeEvery": self.keyframeEvery, "generations": [[record.generation, record.startFrame] for record in self.generations]}
+        arrays = {"header": np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)}
+        for index, record in enumerate(self.generations):
+            arrays.update({"{}/{}".format(index, name): array for name, array in record.toArrays().items()})
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+
+class ReplayOrganism:
+    """Stands in for "engine.Organism" when drawing a replay, without building a brain."""
+    def __init__(self, genome):
+        self.genome = genome
+        self.color = [value if 0 <= value <= 255 else 0 for value in engine.genomeColor(genome)]
+
+    def __repr__(self):
+        return "Organism with genome {}".format(self.genome)
+
+
+class Replay:
+    """
+    Plays back a recording. It has the same "grid", "organisms", "generation", "frames" and "population" as a snapshot of the simulation,
+    so it can be drawn by "render.FieldRenderer" and stepped or seeked in both directions.
+    """
+    def __init__(self, size, generations, keyframeEvery=KEYFRAME_EVERY):
+        self.size = size
+        self.records: list[GenerationRecord] = generations
+        self.keyframeEvery = keyframeEvery
+        self.grid = np.full(size, -1, dtype=np.int32)
+        self.index = None
+        self.seek(0, self.records[0].startFrame)
+
+    def __repr__(self):
+        return "Replay of {} generations at generation {} frame {}".format(len(self.records), self.generation, self.frames)
+
+    @classmethod
+    def fromRecorder(cls, recorder: MoveRecorder):
+        return cls(recorder.size, recorder.generations, recorder.keyframeEvery)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        header = json.loads(arrays["header"].tobytes())
+        names = ["positions", "alive", "genomes", "genomeIndices", "steps", "keyframes", "keyframePositions", "keyframeAlive"]
+        generations = [GenerationRecord.fromArrays(generation, startFrame, {name: arrays["{}/{}".format(index, name)] for name in names}) for index, (generation, startFrame) in enumerate(header["generations"])]
+        return cls(header["size"], generations, header["keyframeEvery"])
+
+    @property
+    def record(self):
+        return self.records[self.index]
+
+    @property
+    def generation(self):
+        return self.record.generation
+
+    @property
+    def population(self):
+        return int(np.count_nonzero(self.alive))
+
+    def organismAt(self, position):
+        if (index := self.grid[position[0], position[1]]) < 0:
+            return None
+        return self.organisms[index]
+
+    def seek(self, index, frame):
+        """Jumps to "frame" of the generation at "index" in the recording, starting from the closest keyframe before it."""
+        if index != self.index:
+            self.index = index
+            table = [ReplayOrganism(genome) for genome in self.record.genomes.tolist()]
+            self.organisms = [table[genomeIndex] for genomeIndex in self.record.genomeIndices.tolist()]
+        frame = min(max(frame, self.record.startFrame), self.record.frames)
+        start = max([keyframe for keyframe in self.record.keyframes if keyframe <= frame], default=self.record.startFrame)
+        positions, alive = self.record.keyframes[start] if start in self.record.keyframes else (self.record.positions, self.record.alive)
+        self.positions = positions.astype(np.int64)
+        self.alive = alive.copy()
+        self.frames = start
+        self.updateGrid()
+        self.apply(frame-start)
+
+    def apply(self, frames):
+        """Applies the steps of the next "frames" frames, or undoes the previous ones if "frames" is negative."""
+        first, last = sorted([self.frames, self.frames+frames])
+        if first == last:
+            return self.updateGrid()
+        # Only organisms that moved, were removed or came back have to be changed in the grid.
+        changed, steps, removed = decodeSteps(np.array(self.record.steps[first-self.record.startFrame:last-self.record.startFrame]))
+        # Organisms coming back aren't in the grid, their cell may be used by another one.
+        shown = changed[self.grid[self.positions[changed, 0], self.positions[changed, 1]] == changed]
+        self.grid[self.positions[shown, 0], self.positions[shown, 1]] = -1
+        if frames > 0:
+            self.positions[changed] += steps
+            self.alive[changed] &= ~removed
+        else:
+            self.positions[changed] -= steps
+            self.alive[changed] |= removed
+        changed = changed[self.alive[changed]]
+        self.grid[self.positions[changed, 0], self.positions[changed, 1]] = changed
+        self.frames += frames
+
+    def updateGrid(self):
+        self.grid.fill(-1)
+        indices = np.flatnonzero(self.alive)
+        self.grid[self.positions[indices, 0], self.positions[indices, 1]] = indices
+
+    def step(self, frames=1):
+        """Moves by "frames" frames, continuing into the next or previous generation at the ends of the current one."""
+        target = self.frames + frames
+        while target > self.record.frames and self.index < len(self.records)-1:
+            target -= self.record.frames
+            self.seek(self.index+1, self.records[self.index+1].startFrame)
+            target += self.record.startFrame
+        while target < self.record.startFrame and self.index > 0:
+            target += self.records[self.index-1].frames - self.record.startFrame
+            self.seek(self.index-1, self.records[self.index-1].frames)
+        target = min(max(target, self.record.startFrame), self.record.frames)
+        if abs(target-self.frames) > self.keyframeEvery:
+            self.seek(self.index, target)
+        else:
+            self.apply(target-self.frames)
+
+    def seekGeneration(self, offset):
+        """Jumps "offset" generations forward or backward, to the same frame if possible."""
+        self.seek(min(max(self.index+offset, 0), len(self.records)-1), self.frames)
+
+
+def main():
+    import pygame as pg
+    from render import FieldRenderer
+
+    parser = argparse.ArgumentParser(description="Plays back a recording. Space pauses, left/right steps a frame, up/down jumps a generation, +/- change the speed.")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=int, default=1, help="Frames per displayed frame.")
+    parser.add_argument("--fps", type=int, default=60)
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    pg.init()
+    pg.font.init()
+    screen = pg.display.set_mode((0, 0), pg.FULLSCREEN)
+    font = pg.font.SysFont("Arial Black", 30)
+    squareSize = min(screen.get_size())
+    fieldRenderer = FieldRenderer(replay.size, [squareSize//replay.size[0], squareSize//replay.size[1]])
+    clock = pg.time.Clock()
+    screen.fill((255, 255, 255))
+    speed, paused, running = args.speed, False, True
+    while running:
+        for event in pg.event.get():
+            if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+                running = False
+            elif event.type == pg.KEYDOWN:
+                if event.key == pg.K_SPACE:
+                    paused = not paused
+                elif event.key in [pg.K_RIGHT, pg.K_LEFT]:
+                    replay.step(1 if event.key == pg.K_RIGHT else -1)
+                elif event.key in [pg.K_UP, pg.K_DOWN]:
+                    replay.seekGeneration(1 if event.key == pg.K_UP else -1)
+                elif event.key in [pg.K_PLUS, pg.K_KP_PLUS, pg.K_MINUS, pg.K_KP_MINUS]:
+                    speed = max(1, speed*2 if event.key in [pg.K_PLUS, pg.K_KP_PLUS] else speed//2)
+        if not paused:
+            replay.step(speed)
+        fieldRenderer(screen, replay)
+        pg.draw.rect(screen, (255, 255, 255), [squareSize, 0, screen.get_width()-squareSize, 100])
+        screen.blit(font.render("Generation {}, frame {}, x{}".format(replay.generation, replay.frames, speed), False, (0, 0, 0)), [squareSize+10, 10])
+        pg.display.update()
+        clock.tick(args.fps)
+    pg.quit()
+
+
+if __name__ == "__main__":
+    main()
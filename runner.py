@@ -0,0 +1,150 @@
+################################################################
+# Runs a simulation on a thread of its own, independent of how fast it is displayed.
+# The viewer only ever reads snapshots the engine thread published and hands changes to the simulation back as commands,
+# which are run on the engine thread between two steps.
+################################################################
+import threading
+import queue
+import time
+import numpy as np
+from sparse import ChunkedGrid
+
+STEPS_PER_SECOND = 6 # Speed outside of turbo mode, the same as one step every 10 frames at 60 frames per second.
+TARGET_FPS = 60
+MAX_STEPS_PER_FRAME = 10_000
+
+
+class FieldSnapshot:
+    """State of the field at one point in time, as much of it as is needed for drawing and selecting organisms."""
+    def __init__(self, size, sparse=False):
+        self.grid = ChunkedGrid(size) if sparse else np.full(size, -1, dtype=np.int32)
+        self.organisms = []
+        self.generation = 0
+        self.frames = 0
+        self.population = 0
+        self.version = 0
+
+    def __repr__(self):
+        return "FieldSnapshot of generation {} at frame {}".format(self.generation, self.frames)
+
+    def copyFrom(self, simulation):
+        if isinstance(simulation.grid, np.ndarray):
+            np.copyto(self.grid, simulation.grid)
+        else:
+            self.grid = simulation.grid.copy() # A sparse grid is copied as a whole, which only costs as much as the chunks in use.
+        self.organisms = simulation.organisms # Never changed in place, a new generation replaces the whole list.
+        self.generation = simulation.generation
+        self.frames = simulation.frames
+        self.population = simulation.population
+
+    def organismAt(self, position):
+        if (index := self.grid[position[0], position[1]]) < 0:
+            return None
+        return self.organisms[index]
+
+    def randomOrganism(self, rng=None):
+        occupied = np.flatnonzero(self.grid >= 0) if isinstance(self.grid, np.ndarray) else self.grid.occupiedCells()
+        if not len(occupied):
+            return None
+        return self.organisms[self.grid.flat[(rng or np.random.default_rng()).choice(occupied)]]
+
+
+class SnapshotBuffer:
+    """
+    Two snapshots, the front one readable by the viewer and the back one written by the engine, swapped when a new one is published.
+    A snapshot is only published after the viewer took the current front, so the back one is never the one the viewer is still drawing.
+    """
+    def __init__(self, size, sparse=False):
+        self.front = FieldSnapshot(size, sparse)
+        self.back = FieldSnapshot(size, sparse)
+        self.lock = threading.Lock()
+        self.taken = threading.Event()
+        self.taken.set()
+
+    def publish(self, simulation):
+        self.back.copyFrom(simulation)
+        with self.lock:
+            self.back.version = self.front.version + 1
+            self.front, self.back = self.back, self.front
+            self.taken.clear()
+
+    def take(self):
+        """Returns the newest snapshot, it stays unchanged until "take" is called again."""
+        with self.lock:
+            self.taken.set()
+            return self.front
+
+
+class SimulationRunner:
+    """
+    Steps "simulation" on a background thread. Normally it runs "stepsPerSecond" steps per second,
+    in turbo mode it runs as many as it can and only publishes a snapshot every "stepsPerFrame" steps,
+    with "stepsPerFrame" tuned so that a new snapshot is ready "targetFPS" times per second.
+    """
+    def __init__(self, simulation, stepsPerSecond=STEPS_PER_SECOND, targetFPS=TARGET_FPS):
+        self.simulation = simulation
+        self.stepsPerSecond = stepsPerSecond
+        self.targetFPS = targetFPS
+        self.stepsPerFrame = 1
+        self.turbo = False
+        self.paused = False
+        self.commands = queue.Queue()
+        self.buffer = SnapshotBuffer(simulation.size, simulation.sparse)
+        self.buffer.publish(simulation)
+        self.batchTime = None # Smoothed seconds it takes to run "stepsPerFrame" steps.
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return "SimulationRunner ({}) with {} steps per frame".format("paused" if self.paused else "turbo" if self.turbo else "running", self.stepsPerFrame)
+
+    def submit(self, command):
+        """Runs "command(simulation)" on the engine thread before the next step, the only safe way to change the simulation while it runs."""
+        self.commands.put(command)
+
+    def snapshot(self):
+        """Returns the newest snapshot for the viewer, it stays unchanged until this is called again."""
+        return self.buffer.take()
+
+    def tune(self, seconds):
+        """Scales "stepsPerFrame" after running it in "seconds", at most doubling or halving it at once to stay stable."""
+        self.batchTime = seconds if self.batchTime is None else 0.8*self.batchTime + 0.2*seconds
+        factor = min(max((1/self.targetFPS)/max(self.batchTime, 1e-6), 0.5), 2)
+        self.stepsPerFrame = int(min(max(round(self.stepsPerFrame*factor), 1), MAX_STEPS_PER_FRAME))
+
+    def runCommands(self):
+        ran = False
+        while not self.commands.empty():
+            self.commands.get()(self.simulation)
+            ran = True
+        return ran
+
+    def run(self):
+        nextStep = time.perf_counter()
+        while self.running:
+            changed = self.runCommands()
+            if not self.paused:
+                if self.turbo:
+                    startTime = time.perf_counter()
+                    for _ in range(self.stepsPerFrame):
+                        self.simulation()
+                    self.tune(time.perf_counter()-startTime)
+                elif time.perf_counter() >= nextStep:
+                    self.simulation()
+                    nextStep = max(nextStep + 1/self.stepsPerSecond, time.perf_counter() - 1/self.stepsPerSecond)
+                    changed = True
+                changed = changed or self.turbo
+            if changed:
+                # Waits for the viewer to take the previous snapshot, in turbo mode this is what keeps the engine from running away from the display.
+                while self.running and not self.buffer.taken.wait(0.1):
+                    pass
+                self.buffer.publish(self.simulation)
+            else:
+                time.sleep(0.002)
+
+    def close(self):
+        """Stops the engine thread after the current step, remaining commands are still run."""
+        self.running = False
+        self.thread.join()
+        self.runCommands()
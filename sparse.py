@@ -0,0 +1,197 @@
+# Storage for very large fields with few organisms
+# The field is split into square chunks that are only allocated once something is stored in them and released again once enough of them are empty,
+# so memory and the cost of every operation grow with the number of organisms instead of the area of the field.
+import numpy as np
+from occupancy import CellIndex
+
+CHUNK_SIZE = 8 # Cells along each side of a chunk.
+MIN_RETAINED = 64 # Empty chunks are kept until more than twice this many are allocated.
+
+
+class ChunkedGrid:
+    """
+    Stands in for the dense occupancy grid of a simulation, it supports the same indexing with coordinate arrays, single cells and slices,
+    "fill", "copy" and "flat". Cells that were never written hold "fillValue". A single assignment must not write the same cell twice.
+    """
+    def __init__(self, size, fillValue=-1, dtype=np.int32, chunkSize=CHUNK_SIZE):
+        self.shape = tuple(size)
+        self.fillValue = fillValue
+        self.dtype = np.dtype(dtype)
+        self.chunkSize = chunkSize
+        self.clear()
+
+    def __repr__(self):
+        return "ChunkedGrid of {}x{} cells with {} chunks allocated".format(*self.shape, self.allocated)
+
+    def clear(self):
+        # Chunk 0 always stays empty, every chunk that isn't allocated points to it, so reading never has to check for missing chunks.
+        self.directory = np.zeros((-(-self.shape[0]//self.chunkSize), -(-self.shape[1]//self.chunkSize)), dtype=np.int32)
+        self.chunks = np.full((1, self.chunkSize, self.chunkSize), self.fillValue, dtype=self.dtype)
+        self.counts = np.zeros(1, dtype=np.int64) # Cells not holding "fillValue" in every chunk.
+        self.owners = np.zeros((1, 2), dtype=np.int32) # Position of every chunk in the directory.
+        self.freeChunks = np.zeros(0, dtype=np.int64) # Chunks that were released and can be used again.
+        self.used = 1
+        self.retained = 0 # Chunks still allocated after empty ones were released the last time.
+
+    @property
+    def size(self):
+        return self.shape[0]*self.shape[1]
+
+    @property
+    def allocated(self):
+        return self.used - 1 - len(self.freeChunks)
+
+    @property
+    def nbytes(self):
+        return self.directory.nbytes + self.chunks.nbytes + self.counts.nbytes + self.owners.nbytes
+
+    @property
+    def flat(self):
+        return FlatCells(self)
+
+    def coordinates(self, key):
+        """Turns an index of the grid into two coordinate arrays of the same shape, slices become the coordinates of every cell of the window."""
+        xs, ys = key
+        if isinstance(xs, slice) or isinstance(ys, slice):
+            # Windows are only taken with slices along both axes.
+            xs, ys = np.arange(*xs.indices(self.shape[0]))[:, None], np.arange(*ys.indices(self.shape[1]))[None, :]
+        return np.broadcast_arrays(np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64))
+
+    def __getitem__(self, key):
+        xs, ys = self.coordinates(key)
+        values = self.chunks[self.directory[xs//self.chunkSize, ys//self.chunkSize], xs%self.chunkSize, ys%self.chunkSize]
+        return values[()] if values.ndim == 0 else values
+
+    def __setitem__(self, key, values):
+        xs, ys = self.coordinates(key)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), xs.shape).reshape(-1)
+        xs, ys = xs.reshape(-1), ys.reshape(-1)
+        chunkXs, chunkYs = xs//self.chunkSize, ys//self.chunkSize
+        stored = values != self.fillValue
+        if (missing := stored & (self.directory[chunkXs, chunkYs] == 0)).any():
+            self.allocate(np.stack(np.divmod(np.unique(chunkXs[missing]*self.directory.shape[1] + chunkYs[missing]), self.directory.shape[1]), axis=1))
+        chunks = self.directory[chunkXs, chunkYs]
+        written = chunks != 0 # Clearing cells of chunks that don't exist does nothing.
+        chunks, xs, ys, values, stored = chunks[written], xs[written]%self.chunkSize, ys[written]%self.chunkSize, values[written], stored[written]
+        np.add.at(self.counts, chunks, stored.astype(np.int64) - (self.chunks[chunks, xs, ys] != self.fillValue))
+        self.chunks[chunks, xs, ys] = values
+        # Organisms often leave a chunk right before moving back in, so empty chunks are only released once twice as many are allocated as before.
+        if self.allocated > 2*max(self.retained, MIN_RETAINED):
+            self.release()
+
+    def allocate(self, positions):
+        """Creates empty chunks at the given directory positions."""
+        reused = self.freeChunks[len(self.freeChunks)-min(len(positions), len(self.freeChunks)):]
+        self.freeChunks = self.freeChunks[:len(self.freeChunks)-len(reused)]
+        indices = np.concatenate((reused, np.arange(self.used, self.used + len(positions) - len(reused))))
+        self.used += len(positions) - len(reused)
+        if self.used > len(self.chunks):
+            capacity = max(self.used, 2*len(self.chunks))
+            self.chunks = np.concatenate((self.chunks, np.full((capacity-len(self.chunks), self.chunkSize, self.chunkSize), self.fillValue, dtype=self.dtype)))
+            self.counts = np.concatenate((self.counts, np.zeros(capacity-len(self.counts), dtype=np.int64)))
+            self.owners = np.concatenate((self.owners, np.zeros((capacity-len(self.owners), 2), dtype=np.int32)))
+        self.directory[positions[:, 0], positions[:, 1]] = indices
+        self.owners[indices] = positions
+
+    def release(self):
+        """Returns all empty chunks to the free chunks."""
+        chunks = np.arange(1, self.used)
+        inUse = self.directory[self.owners[chunks, 0], self.owners[chunks, 1]] == chunks
+        empty = chunks[inUse & (self.counts[chunks] == 0)]
+        self.directory[self.owners[empty, 0], self.owners[empty, 1]] = 0
+        self.freeChunks = np.concatenate((self.freeChunks, empty))
+        self.retained = self.allocated
+
+    def fill(self, value):
+        if value != self.fillValue:
+            raise ValueError("A chunked grid can only be filled with its fill value!")
+        self.clear()
+
+    def copy(self):
+        copied = ChunkedGrid.__new__(ChunkedGrid)
+        copied.__dict__.update(self.__dict__)
+        for name in ["directory", "chunks", "counts", "owners", "freeChunks"]:
+            setattr(copied, name, getattr(self, name).copy())
+        return copied
+
+    def occupiedCells(self):
+        """Flat numbers (x * size[1] + y) of all cells not holding "fillValue" in ascending order, same as "np.flatnonzero(grid != fillValue)"."""
+        chunks, xs, ys = np.nonzero(self.chunks[:self.used] != self.fillValue)
+        xs, ys = self.owners[chunks, 0].astype(np.int64)*self.chunkSize + xs, self.owners[chunks, 1].astype(np.int64)*self.chunkSize + ys
+        return np.sort(xs*self.shape[1] + ys)
+
+    def tobytes(self):
+        """The values of all cells not holding "fillValue" together with their cells, equal for equal grids whatever their chunks."""
+        cells = self.occupiedCells()
+        return cells.tobytes() + self.flat[cells].tobytes()
+
+
+class FlatCells:
+    """Reads cells of a "ChunkedGrid" by their flat number like "np.ndarray.flat"."""
+    def __init__(self, grid: ChunkedGrid):
+        self.grid = grid
+
+    def __getitem__(self, cells):
+        return self.grid[np.divmod(cells, self.grid.shape[1])]
+
+
+class SparseCellIndex(CellIndex):
+    """
+    Same as "CellIndex", but only stores the occupied cells, the slot of every occupied cell is kept in a "ChunkedGrid".
+    Free cells are drawn at random and checked instead of being picked from a list of all free cells.
+    """
+    def reset(self, occupied=()):
+        self.cells = np.unique(np.asarray(occupied, dtype=np.int64))
+        self.count = len(self.cells)
+        self.slots = ChunkedGrid(self.size)
+        self.setSlots(self.cells, np.arange(self.count))
+
+    def setSlots(self, cells, slots):
+        self.slots[np.divmod(cells, self.size[1])] = slots
+
+    def isOccupied(self, cell):
+        return self.slots.flat[cell] >= 0
+
+    def occupy(self, cell):
+        if not self.isOccupied(cell):
+            if self.count == len(self.cells):
+                self.cells = np.concatenate((self.cells, np.zeros(max(self.count, 1), dtype=np.int64)))
+            self.cells[self.count] = cell
+            self.setSlots(cell, self.count)
+            self.count += 1
+
+    def release(self, cell):
+        if self.isOccupied(cell):
+            slot, last = self.slots.flat[cell], self.cells[self.count-1]
+            self.cells[slot] = last
+            self.setSlots(cell, -1)
+            if last != cell:
+                self.setSlots(last, slot)
+            self.count -= 1
+
+    def moveMany(self, oldCells, newCells):
+        oldSlots = self.slots.flat[oldCells]
+        self.cells[oldSlots] = newCells
+        self.setSlots(oldCells, -1)
+        self.setSlots(newCells, oldSlots)
+
+    def sampleFree(self, amount, rng: np.random.Generator):
+        amount = min(amount, self.free)
+        if (self.free-amount)*4 < self.area:
+            # Once the chosen cells are taken, mostly occupied fields have too few free cells left to find the last ones by chance,
+            # listing them costs about as much as the organisms on them.
+            freeCells = np.setdiff1d(np.arange(self.area), self.cells[:self.count])
+            return freeCells[rng.choice(len(freeCells), amount, replace=False)]
+        chosen = np.zeros(0, dtype=np.int64)
+        while len(chosen) < amount:
+            candidates = rng.integers(0, self.area, size=2*(amount-len(chosen)) + 16)
+            chosen = np.concatenate((chosen, candidates[~self.isOccupied(candidates)]))
+            # Keeps the first draw of every cell, in the order they were drawn.
+            chosen = chosen[np.sort(np.unique(chosen, return_index=True)[1])]
+        return chosen[:amount]
+
+    def randomOccupied(self, rng: np.random.Generator):
+        return int(self.cells[rng.integers(self.count)]) if self.count else None
+
+    def randomFree(self, rng: np.random.Generator):
+        return int(self.sampleFree(1, rng)[0]) if self.free else None
@@ -0,0 +1,130 @@
+# Registry of the distinct genomes of a simulation
+# Organisms with the same genome belong to one species, which owns the genome, the compiled brain and the color. The simulation itself only keeps
+# the species ID of every organism next to its position, direction and motivation, so a population of clones costs little more than those arrays.
+import types
+import sys
+import numpy as np
+
+
+class SpeciesRegistry:
+    """
+    Interns genomes as species, "createSpecies" turns a list of genomes into one object each (see "engine.createOrganisms").
+    "genomeLength" is the width of the genome table while there are no species to tell it from. Species IDs are only stable until "setMembers" is called, like organism indices are only stable within a generation.
+    """
+    def __init__(self, createSpecies, genomeLength=0):
+        self.createSpecies = createSpecies
+        self.genomeLength = genomeLength
+        self.species = [] # Species object by ID.
+        self.keys = [] # Genome of every species as a tuple.
+        self.ids = {} # Species ID by genome tuple.
+        self.counts = np.zeros(0, dtype=np.int64) # Living members by species ID.
+        self.genomeTable = None # Genomes of all species as an array, built when needed.
+
+    def __repr__(self):
+        return "SpeciesRegistry with {} species".format(len(self))
+
+    def __len__(self):
+        return len(self.species)
+
+    def __getitem__(self, speciesID):
+        return self.species[speciesID]
+
+    def intern(self, genomes):
+        """Returns the species ID of every genome, creating the species of genomes that aren't registered yet."""
+        genomes = genomes if isinstance(genomes, np.ndarray) else np.array(genomes, dtype=object if len({len(genome) for genome in genomes}) > 1 else np.uint32)
+        if genomes.dtype != object and genomes.ndim == 2:
+            # Clonal populations only have a few distinct rows, so only those have to be looked up.
+            distinct, inverse = np.unique(genomes, axis=0, return_inverse=True)
+            return self.internKeys(distinct.tolist())[inverse.reshape(-1)] if len(distinct) < len(genomes) else self.internKeys(genomes.tolist())
+        return self.internKeys([list(genome) for genome in genomes])
+
+    def internKeys(self, genomes):
+        keys = [tuple(genome) for genome in genomes]
+        missing = list(dict.fromkeys(key for key in keys if key not in self.ids))
+        if missing:
+            for key, species in zip(missing, self.createSpecies([list(key) for key in missing])):
+                self.ids[key] = len(self.species)
+                self.species.append(species)
+                self.keys.append(key)
+            self.counts = np.concatenate((self.counts, np.zeros(len(missing), dtype=np.int64)))
+            self.genomeTable = None
+        return np.fromiter((self.ids[key] for key in keys), dtype=np.int32, count=len(keys))
+
+    def setMembers(self, speciesIDs):
+        """
+        Counts the members of every species from the IDs of all organisms, species without members are dropped.
+        Returns "speciesIDs" renumbered to match, the IDs passed in are no longer valid afterwards.
+        """
+        speciesIDs = np.asarray(speciesIDs, dtype=np.int32).reshape(-1)
+        counts = np.bincount(speciesIDs, minlength=len(self.species))
+        kept = np.flatnonzero(counts)
+        if len(kept) < len(self.species):
+            renumbered = np.full(len(self.species), -1, dtype=np.int32)
+            renumbered[kept] = np.arange(len(kept), dtype=np.int32)
+            self.species = [self.species[index] for index in kept]
+            self.keys = [self.keys[index] for index in kept]
+            self.ids = {key: index for index, key in enumerate(self.keys)}
+            self.genomeTable = None
+            speciesIDs = renumbered[speciesIDs]
+        self.counts = counts[kept]
+        return speciesIDs
+
+    def remove(self, speciesID):
+        """Counts one member less, the species itself stays registered until the next "setMembers"."""
+        self.counts[speciesID] -= 1
+
+    def members(self, speciesIDs):
+        return Members(self.species, speciesIDs)
+
+    def genomes(self):
+        """Genomes of all species as a uint32 array with one row per species ID, all genomes have to be of the same length."""
+        if self.genomeTable is None:
+            self.genomeTable = np.array(self.keys, dtype=np.uint32).reshape(len(self.keys), -1 if self.keys else self.genomeLength)
+        return self.genomeTable
+
+    @property
+    def living(self):
+        """Number of species with at least one living member."""
+        return int(np.count_nonzero(self.counts))
+
+    def nbytes(self):
+        """Memory used by the registry and everything its species own, objects shared between species are only counted once."""
+        seen = set()
+        return deepSize(self.species, seen) + deepSize(self.keys, seen) + deepSize(self.ids, seen) + self.counts.nbytes
+
+
+class Members:
+    """Read only list of the species of every organism, "members[index]" is the species of the organism with that index."""
+    def __init__(self, species, speciesIDs):
+        self.species = species
+        self.speciesIDs = speciesIDs
+
+    def __repr__(self):
+        return "Members of {} organisms".format(len(self))
+
+    def __len__(self):
+        return len(self.speciesIDs)
+
+    def __getitem__(self, index):
+        return self.species[self.speciesIDs[index]]
+
+    def __iter__(self):
+        return (self.species[speciesID] for speciesID in self.speciesIDs.tolist())
+
+
+def deepSize(value, seen=None):
+    """Bytes used by "value" and all objects it references through containers, attributes and numpy arrays. Objects in "seen" are skipped."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) if value.base is None else sys.getsizeof(value) + deepSize(value.base, seen)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deepSize(key, seen) + deepSize(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deepSize(item, seen) for item in value)
+    elif hasattr(value, "__dict__") and not isinstance(value, (type, types.FunctionType, types.ModuleType)):
+        size += deepSize(vars(value), seen)
+    return size
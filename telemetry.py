@@ -0,0 +1,69 @@
+# Streams the record of every generation into a JSON lines or CSV file
+# Records are buffered and written in batches, a batch is flushed once it is full or a few seconds old,
+# so a file that is followed with "tail -f" stays current during long runs without writing on every generation.
+import json
+import csv
+import time
+import os
+
+FLUSH_EVERY = 50 # Number of records buffered before they are written.
+FLUSH_SECONDS = 5.0 # Buffered records are written at the next generation after this many seconds, even if the buffer isn't full.
+
+
+class TelemetrySink:
+    """
+    Listener for "Simulation.listeners" that appends every record to "path". The format is chosen by the extension, ".csv" for CSV and JSON lines otherwise.
+    CSV columns are taken from the first record or from the header of an existing file, fields that aren't columns are left out.
+    """
+    def __init__(self, path, flushEvery=FLUSH_EVERY, flushSeconds=FLUSH_SECONDS):
+        self.path = path
+        self.format = "csv" if os.path.splitext(path)[1].lower() == ".csv" else "jsonl"
+        self.flushEvery = flushEvery
+        self.flushSeconds = flushSeconds
+        self.buffer = []
+        self.columns = None
+        if self.format == "csv" and os.path.exists(path) and os.path.getsize(path):
+            with open(path, "r", newline="") as f:
+                self.columns = next(csv.reader(f))
+        self.lastFlush = time.perf_counter()
+        self.written = 0
+        self.seconds = 0.0 # Time spent inside the sink, to check that logging stays cheap compared to stepping.
+
+    def __repr__(self):
+        return "TelemetrySink to {} with {} written and {} buffered".format(self.path, self.written, len(self.buffer))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __call__(self, simulation, record):
+        startTime = time.perf_counter()
+        self.buffer.append(record)
+        if len(self.buffer) >= self.flushEvery or startTime-self.lastFlush >= self.flushSeconds:
+            self.flush()
+        self.seconds += time.perf_counter()-startTime
+
+    def attach(self, simulation):
+        simulation.listeners.append(self)
+        return self
+
+    def flush(self):
+        """Writes all buffered records to the file."""
+        if self.buffer:
+            with open(self.path, "a", newline="") as f:
+                if self.format == "csv":
+                    writer = csv.DictWriter(f, self.columns or list(self.buffer[0]), extrasaction="ignore")
+                    if self.columns is None:
+                        self.columns = writer.fieldnames
+                        writer.writeheader()
+                    writer.writerows(self.buffer)
+                else:
+                    f.write("".join(json.dumps(record) + "\n" for record in self.buffer))
+            self.written += len(self.buffer)
+            self.buffer.clear()
+        self.lastFlush = time.perf_counter()
+
+    def close(self):
+        self.flush()
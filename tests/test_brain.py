@@ -0,0 +1,77 @@
+# Tests of brains and the contexts they run in
+import threading
+import random
+import numpy as np
+import brain
+import engine
+
+
+def runSimulation(size, seed, generationLength=10, **settings):
+    random.seed(seed)
+    simulation = engine.Simulation(size, population=200, generationLength=generationLength, **settings)
+    for _ in range(25):
+        simulation()
+    return simulation
+
+
+def testSimulationsShareContextInThreads():
+    # With generations this long every species is worth a decision table.
+    settings = {"generationLength": 1000, "decisionTables": True}
+    context = brain.BrainContext([30, 30])
+    expected = [runSimulation([30, 30], seed, context=brain.BrainContext([30, 30]), **settings) for seed in range(4)]
+    results = {}
+    threads = [threading.Thread(target=lambda seed=seed: results.setdefault(seed, runSimulation([30, 30], seed, context=context, **settings))) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for seed, simulation in enumerate(expected):
+        assert np.array_equal(simulation.positions, results[seed].positions)
+    tables = context.decisionTables
+    assert len(tables) and tables.bytes == sum(table.nbytes for table in tables.tables.values())
+
+
+def testSimulationsOfDifferentSizes():
+    small, large = runSimulation([30, 30], 1), runSimulation([40, 25], 1)
+    assert small.context.fieldSize == [30, 30] and large.context.fieldSize == [40, 25]
+    assert np.array_equal(runSimulation([30, 30], 1).positions, small.positions)
+
+
+def decodeGeneWithStrings(gene):
+    """The decoder before "brain.decodeGenes", reading the bits of a gene from its binary string."""
+    binary = f'{bin(gene).replace("0b", ""):0>32}'
+    source, sourceInt, target, targetInt = int(binary[0], 2), int(binary[1:8], 2), int(binary[9], 2), int(binary[10:16], 2)
+    isNegative, weight = int(binary[17]), int(binary[18:], 2)
+    sourceID = brain.internalNodeIDs[sourceInt%len(brain.internalNodeIDs)] if source else brain.sensoryNodeIDs[sourceInt%len(brain.sensoryNodeIDs)]
+    targetID = brain.internalNodeIDs[targetInt%len(brain.internalNodeIDs)] if target else brain.actionNodeIDs[targetInt%len(brain.actionNodeIDs)]
+    return sourceID, targetID, (-1 if isNegative else 1) * round((weight/brain.WEIGHT_CONSTANT), 2)
+
+
+def testDecodeSameAsStrings():
+    rng = np.random.default_rng(1)
+    # Every weight with both signs, then random genes and the highest one.
+    genes = np.concatenate((np.arange(2**15, dtype=np.uint32) | rng.integers(0, 2**17, 2**15, dtype=np.uint32) << 15, rng.integers(0, 2**32, 200_000, dtype=np.uint32), [2**32-1]))
+    sourceIDs, targetIDs, weights = brain.decodeGenes(genes)
+    assert list(zip(sourceIDs.tolist(), targetIDs.tolist(), weights.tolist())) == [decodeGeneWithStrings(gene) for gene in genes.tolist()]
+    # Whole genomes decode the same as their genes one by one.
+    genomes = genes[:200_000].reshape(-1, 8)
+    assert all(np.array_equal(decoded.reshape(-1), single) for decoded, single in zip(brain.decodeGenes(genomes), brain.decodeGenes(genomes.reshape(-1))))
+
+
+def testBrainCache():
+    cache = brain.BrainCache(maxSize=3)
+    genomes = [[index, index+1] for index in range(5)]
+    first = cache(genomes[0])
+    assert cache(np.array(genomes[0], dtype=np.uint32)) is first and (cache.hits, cache.misses) == (1, 1)
+    cache(genomes[1])
+    cache(genomes[2])
+    cache(genomes[0]) # Now the most recently used, so genome 1 is evicted next.
+    cache(genomes[3])
+    assert len(cache) == 3 and tuple(genomes[1]) not in cache.brains and cache(genomes[0]) is first
+    assert (cache.hits, cache.misses) == (3, 4)
+    brains = cache.many([genomes[4], genomes[3], genomes[4], genomes[1]])
+    assert brains[0] is brains[2] and brains[1] is cache(genomes[3])
+    assert (cache.hits, cache.misses) == (6, 6) # Genome 4 is only decoded once.
+    assert list(cache.brains) == [tuple(genomes[index]) for index in [4, 1, 3]]
+    cache.clear()
+    assert len(cache) == 0 and (cache.hits, cache.misses) == (0, 0)
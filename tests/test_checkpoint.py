@@ -0,0 +1,35 @@
+# Tests of the binary checkpoints and their background writer
+import time
+import os
+import checkpoint
+import engine
+
+
+def testWriterEmptyPopulation(tmp_path):
+    writer = checkpoint.CheckpointWriter(str(tmp_path))
+    fileName = writer.submit(engine.Simulation([10, 10], population=0, seed=1))
+    writer.close()
+    assert writer.stats()["written"] == 1 and engine.load(fileName).population == 0
+
+
+def testWriterSurvivesErrors(tmp_path):
+    simulation = engine.Simulation([10, 10], population=5, seed=1)
+    writer = checkpoint.CheckpointWriter(str(tmp_path), keep=1)
+    writer.queue.put((str(tmp_path / "broken"), {}, {}, 0)) # Can't be encoded.
+    first = writer.submit(simulation)
+    while writer.written < 1:
+        time.sleep(0.01)
+    os.remove(first) # Rotation has to cope with files removed by hand.
+    writer.submit(simulation)
+    last = writer.submit(simulation)
+    writer.close()
+    assert writer.failed == 1 and writer.written == 3
+    assert os.listdir(tmp_path) == [os.path.basename(last)]
+
+
+def testCloseAfterThreadStopped(tmp_path):
+    writer = checkpoint.CheckpointWriter(str(tmp_path), maxQueued=1)
+    writer.queue.put(None)
+    writer.thread.join()
+    writer.queue.put(None) # The queue is full and nobody takes from it anymore.
+    writer.close()
@@ -0,0 +1,57 @@
+# Tests of the headless simulation core
+import numpy as np
+import engine
+
+
+def testMutateNoGenomes():
+    genomes = engine.mutateGenomes([], np.random.default_rng(1), 0.1, 0.1, 0.1, genomeLength=7)
+    assert genomes.shape == (0, 7) and genomes.dtype == np.uint32
+    assert engine.mutateGenomes(np.zeros((0, 5), dtype=np.uint32), np.random.default_rng(1), 0.1).shape == (0, 5)
+
+
+def testGenerationWithoutParents():
+    simulation = engine.Simulation([20, 20], population=4, generationLength=5, seed=1)
+    for position in simulation.positions.tolist():
+        simulation.removeAt(position)
+    simulation.nextGeneration(simulation.criteria)
+    assert simulation.generation == 1 and simulation.population == 0
+
+
+def testEmptyPopulation(tmp_path):
+    simulation = engine.Simulation([20, 20], population=0, genomeLength=6, generationLength=3, seed=1)
+    header, arrays = simulation.snapshot()
+    assert arrays["genomes"].shape == (0, 6) and len(arrays["positions"]) == 0
+    for _ in range(7):
+        simulation()
+    assert simulation.generation == 2 and simulation.population == 0
+    loaded = engine.load(engine.save(simulation, str(tmp_path)))
+    assert loaded.population == 0 and loaded.generation == 2 and loaded.genomeLength == 6
+
+
+def testCollisions():
+    simulation = engine.Simulation([5, 5], population=0, genomeLength=4, seed=1)
+    # Four organisms claim the cell (2, 2) from every side, the one at (1, 1) moves diagonally towards it but is blocked along both axes.
+    positions = [[3, 2], [2, 1], [1, 2], [2, 3], [1, 1]]
+    genomes = np.random.default_rng(1).integers(0, 2**32, size=(len(positions), 4), dtype=np.uint32)
+    simulation.setPopulation(positions, simulation.registry.intern(genomes))
+    simulation.move(np.array([[-1, 0], [0, 1], [1, 0], [0, -1], [1, 1]]))
+    assert simulation.positions.tolist() == [[2, 2], [2, 1], [1, 2], [2, 3], [1, 1]] # The lowest index wins, all others stay.
+    cells = simulation.positions[:, 0]*5 + simulation.positions[:, 1]
+    assert len(np.unique(cells)) == len(cells)
+    assert np.array_equal(simulation.grid[simulation.positions[:, 0], simulation.positions[:, 1]], np.arange(len(positions)))
+    assert np.count_nonzero(simulation.grid >= 0) == len(positions)
+    assert np.array_equal(np.sort(simulation.cellIndex.cells[:simulation.population]), np.sort(cells))
+
+
+def testClaimsByIndex():
+    # The winner only depends on the indices, not on the order the organisms are passed in.
+    start = np.array([[0, 1], [2, 1], [1, 0], [1, 2]])
+    final = np.array([[1, 1], [1, 1], [1, 1], [1, 2]])
+    for indices in [[7, 3, 5, 1], [3, 7, 5, 1], [5, 7, 3, 1]]:
+        won = engine.resolveClaims(np.array(indices), start, final, [3, 3])
+        assert won.tolist() == [index == 3 for index in indices[:3]] + [False] # The last one doesn't move.
+
+
+def testCriteriaByName():
+    assert engine.criteriaByName("right") == engine.criteriaByName("Right") == engine.Criteria.RIGHT.id
+    assert [engine.criteriaByName(name) for name in engine.criteriaNames] == engine.criteriaIDs
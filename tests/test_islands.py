@@ -0,0 +1,38 @@
+# Tests of the island model
+import numpy as np
+import pytest
+import islands
+
+# The island with seed 2 dies out in its first generation, the one with seed 1 doesn't.
+ISLANDS = islands.islandGrid(2, 1, ["right"], [0], 8, [30, 30], 3)
+
+
+def testExtinctIslandIsResettled():
+    simulation = islands.createIsland(ISLANDS[1], 10)
+    for _ in range(10):
+        simulation()
+    assert simulation.population == 0 and len(simulation.emigrants(5)) == 0
+    simulation.immigrate(np.arange(24, dtype=np.uint32).reshape(3, 8))
+    assert simulation.population == 3
+    for _ in range(10):
+        simulation()
+    assert simulation.generation == 2
+
+
+def testMigrationAfterExtinction():
+    records = []
+    with islands.IslandModel(ISLANDS, migrants=3, interval=1, generationLength=10) as model:
+        model.listeners.append(lambda model, record: records.append(record))
+        model.run(3)
+    extinct = [record for record in records if record["island"] == 1]
+    assert extinct[0]["populationAfter"] == 0
+    assert extinct[1]["populationBefore"] > 0 # Settled by the emigrants of the other island.
+
+
+def testDeadWorker():
+    with islands.IslandModel(ISLANDS, interval=1, generationLength=10) as model:
+        model.step()
+        model.processes[0].kill()
+        model.processes[0].join()
+        with pytest.raises(RuntimeError):
+            model.step()
@@ -0,0 +1,96 @@
+# Tests of evaluating all brains of a population at once
+import pytest
+import numpy as np
+import brain
+from population import PopulationBrain, FixedPointBrain
+
+SIZE = [40, 30]
+RANDOM_INPUT = 0.375 # Rnd is fixed, so both paths see the same value.
+TIE_TOLERANCE = 5e-5 # How far apart fixed-point and float outputs may be, see "FixedPointBrain".
+
+
+def randomPopulation(seed, count=2000, genomeLength=12, size=SIZE):
+    rng = np.random.default_rng(seed)
+    genomes = rng.integers(0, brain.MAX_GENE_VALUE, size=(count, genomeLength), dtype=np.uint32, endpoint=True)
+    positions = np.stack([rng.integers(0, size[0], count), rng.integers(0, size[1], count)], axis=1)
+    directions = rng.integers(-1, 2, size=(count, 2))
+    return genomes, positions, directions
+
+
+def fixedContext(size=SIZE):
+    context = brain.BrainContext(size)
+    context.sensoryNodes[brain.sensoryNodeIDs.index(brain.nodeTypes.Sensory.Rnd)] = lambda **kwargs: RANDOM_INPUT
+    return context
+
+
+# On 160x160 many positions have sensor values ending in an exact 5 in the fourth decimal, enough brains are needed for a choice to depend on one.
+@pytest.mark.parametrize("size, count, genomeLength", [(SIZE, 2000, 12), ([160, 160], 20000, 20)])
+def testSameAsBrain(size, count, genomeLength):
+    genomes, positions, directions = randomPopulation(1, count, genomeLength, size)
+    brains = [brain.Brain(genome.tolist()) for genome in genomes]
+    context = fixedContext(size)
+    populationBrain = PopulationBrain.fromBrains(brains, size)
+    randomInputs = np.full(len(genomes), RANDOM_INPUT)
+    activeNodes, _ = populationBrain.getActiveNodes(positions, randomInputs)
+    movements = populationBrain(positions, directions, randomInputs, np.zeros((len(genomes), 2), dtype=int))
+    for index, organismBrain in enumerate(brains):
+        position, direction = positions[index].tolist(), directions[index].tolist()
+        assert organismBrain.getActiveNode(position, direction, context)[0] == activeNodes[index]
+        if activeNodes[index] != brain.nodeTypes.Action.Mrn: # Random moves are drawn differently.
+            assert organismBrain(position, direction, context) == movements[index].tolist()
+    assert len(set(activeNodes.tolist())) > 3 # The population covers most actions.
+
+
+def testSensorsSameAsSensoryNodes():
+    for size in [SIZE, [160, 160], [80, 400], [320, 64]]:
+        cells = np.stack(np.divmod(np.arange(size[0]*size[1]), size[1]), axis=1)
+        outputs = PopulationBrain(brain.compileWeights([]), size).sense(cells, np.zeros(len(cells)))
+        for index, nodeID in enumerate(brain.sensoryNodeIDs):
+            if nodeID in brain.positionRequiredNodes:
+                node = brain.SensoryNode(nodeID, size)
+                assert outputs[:, index].tolist() == [node(position=cell) for cell in cells.tolist()]
+
+
+def searchValues(activeNodes, values):
+    """Values "findMax" compares the chosen actions by, actions that support negative values are compared by their magnitude."""
+    negative = np.isin(activeNodes, np.array(brain.actionNodeIDs)[brain.actionSupportsNegativeIndices])
+    return np.where(negative, np.abs(values), values)
+
+
+def testFixedPointSameAsFloat():
+    for seed, genomeLength in [(1, 5), (2, 20), (3, 60)]:
+        genomes, positions, _ = randomPopulation(seed, 20000, genomeLength)
+        weights = brain.compileWeights(genomes)
+        randomInputs = np.random.default_rng(seed).random(len(genomes))*2-1
+        internalCount = len(brain.internalNodeIDs)
+        # Once without internal state and then for a few ticks with it.
+        for floatState, fixedState, ticks in [(None, None, 1), (np.zeros((len(genomes), internalCount)), np.zeros((len(genomes), internalCount)), 3)]:
+            for _ in range(ticks):
+                if fixedState is not None: # Differences in the state would otherwise carry over into the next tick.
+                    fixedState[:] = floatState
+                floatNodes, floatValues = PopulationBrain(weights, SIZE).getActiveNodes(positions, randomInputs, floatState)
+                fixedNodes, fixedValues = FixedPointBrain(weights, SIZE).getActiveNodes(positions, randomInputs, fixedState)
+                assert np.abs(floatValues-fixedValues).max() <= TIE_TOLERANCE
+                different = floatNodes != fixedNodes
+                # The only allowed difference: two actions within a few units of the last decimal of each other.
+                assert np.all(np.abs(searchValues(floatNodes, floatValues) - searchValues(fixedNodes, fixedValues))[different] <= TIE_TOLERANCE)
+                assert different.sum() <= len(genomes)//1000
+
+
+# The genomes logged in log.txt, the first one is also the example of brain.py.
+LOGGED_GENOMES = [
+    [935341282, 3515951229, 2198879245, 2321375513, 3982911623],
+    [2451946857, 3947939384, 3194864124, 848685264, 3629926589]
+]
+
+
+def testFixedPointSameAsFloatForLoggedGenomes():
+    weights = brain.compileWeights(np.array(LOGGED_GENOMES, dtype=np.uint32))
+    for size in [[50, 50], [150, 150]]:
+        cells = np.stack(np.divmod(np.arange(size[0]*size[1]), size[1]), axis=1)
+        positions, species = np.repeat(cells, len(weights), axis=0), np.tile(np.arange(len(weights)), len(cells))
+        for randomInput in np.linspace(-1, 1, 9):
+            randomInputs = np.full(len(positions), randomInput)
+            floatNodes, floatValues = PopulationBrain(weights, size, species).getActiveNodes(positions, randomInputs)
+            fixedNodes, fixedValues = FixedPointBrain(weights, size, species).getActiveNodes(positions, randomInputs)
+            assert np.array_equal(floatNodes, fixedNodes) and np.array_equal(np.sign(floatValues), np.sign(fixedValues))
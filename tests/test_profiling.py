@@ -0,0 +1,59 @@
+# Tests of the phase timers
+import threading
+import queue
+import time
+import sys
+import engine
+from profiling import Profiler
+from runner import SimulationRunner
+
+
+def testStatsWhileRecordingInThread():
+    profiler = Profiler(enabled=True, window=10)
+    running, errors = True, []
+    def record():
+        try:
+            while running:
+                for index in range(50):
+                    profiler.record("phase{}".format(index), 0.001)
+        except Exception as error:
+            errors.append(error)
+    thread = threading.Thread(target=record)
+    switchInterval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6) # Switches threads often enough to hit the race without the lock.
+    thread.start()
+    try:
+        for _ in range(2000):
+            profiler.stats()
+            profiler.reset()
+    finally:
+        running = False
+        thread.join()
+        sys.setswitchinterval(switchInterval)
+    assert not errors
+    assert all(phase["calls"] >= 1 for phase in profiler.stats().values())
+
+
+def testCaptureOfRunner():
+    profiler = Profiler()
+    simulation = engine.Simulation([30, 30], generationLength=10)
+    runner = SimulationRunner(simulation)
+    runner.turbo = True
+    results = queue.Queue()
+    def takeSnapshots(seconds):
+        endTime = time.perf_counter() + seconds
+        while time.perf_counter() < endTime:
+            runner.snapshot()
+            time.sleep(0.001)
+    try:
+        profiler.startCapture()
+        runner.submit(lambda simulation: profiler.startCapture())
+        takeSnapshots(0.5)
+        assert profiler.stopCapture() is None # The engine thread still records.
+        runner.submit(lambda simulation: results.put(profiler.stopCapture(lines=0)))
+        stats = results.get(timeout=5)
+    finally:
+        runner.close()
+    functions = {function for _, _, function in stats.stats}
+    assert {"think", "getActiveNodes", "nextGeneration", "takeSnapshots"} <= functions
+    assert not profiler.capturing
@@ -0,0 +1,64 @@
+# Tests of recording a simulation and playing it back
+import random
+import numpy as np
+import engine
+from replay import MoveRecorder, Replay
+
+
+def recordRun(simulation, steps, removeAtStep=None, keyframeEvery=10):
+    """Records "steps" frames of "simulation", returns the recorder and the grid after every frame and at the start of every generation by (generation, frame)."""
+    recorder = MoveRecorder(simulation, keyframeEvery)
+    grids = {}
+    def storeGrid(simulation, *args):
+        grids[simulation.generation, simulation.frames] = np.array(simulation.grid[:, :])
+    storeGrid(simulation)
+    simulation.frameListeners.append(storeGrid)
+    simulation.listeners.append(storeGrid)
+    for step in range(steps):
+        simulation()
+        if step == removeAtStep: # Shows up in the replay with the steps of the next frame.
+            simulation.removeAt(simulation.positions[np.flatnonzero(simulation.alive)[0]])
+    return recorder, grids
+
+
+def assertShows(replay, grids):
+    assert np.array_equal(replay.grid, grids[replay.generation, replay.frames])
+
+
+def testReplay(tmp_path):
+    random.seed(5)
+    simulation = engine.Simulation([40, 30], generationLength=25)
+    recorder, grids = recordRun(simulation, 60, removeAtStep=12)
+    recorder.save(tmp_path/"run.evr")
+    assert simulation.generation == 2
+    for replay in [Replay.fromRecorder(recorder), Replay.load(tmp_path/"run.evr")]:
+        for index, record in enumerate(replay.records):
+            for frame in range(record.startFrame, record.frames+1):
+                replay.seek(index, frame)
+                assertShows(replay, grids)
+        replay.seek(0, 0)
+        shown = []
+        while (replay.generation, replay.frames) != (2, 10):
+            replay.step()
+            assertShows(replay, grids)
+            shown.append((replay.generation, replay.frames))
+        assert (0, 13) in shown and (0, 25) in shown and (1, 1) in shown # Frames around the removal and the generation boundary.
+        while (replay.generation, replay.frames) != (0, 0):
+            replay.step(-1)
+            assertShows(replay, grids)
+        replay.step(37) # More than "keyframeEvery" at once seeks instead of applying every frame.
+        assertShows(replay, grids)
+        replay.step(-30)
+        assertShows(replay, grids)
+
+
+def testReplayOfWideField(tmp_path):
+    random.seed(6)
+    simulation = engine.Simulation([40_000, 3], population=50, generationLength=10, sparse=True)
+    recorder, grids = recordRun(simulation, 8, keyframeEvery=2)
+    assert simulation.positions[:, 0].max() > np.iinfo(np.int16).max
+    recorder.save(tmp_path/"wide.evr")
+    replay = Replay.load(tmp_path/"wide.evr")
+    for frame in range(9):
+        replay.seek(0, frame)
+        assertShows(replay, grids)
@@ -0,0 +1,87 @@
+# Tests of the storage for very large fields with few organisms
+import random
+import numpy as np
+import engine
+from sparse import ChunkedGrid, SparseCellIndex
+
+SIZE = [203, 157] # Not a multiple of the chunk size, so the last chunks along both axes are partly outside of the field.
+
+
+def testChunkedGridSameAsDense():
+    rng = np.random.default_rng(1)
+    size = [403, 317]
+    grid, dense = ChunkedGrid(size), np.full(size, -1, dtype=np.int32)
+    released = reused = False
+    for step in range(200):
+        allocated, freeChunks = grid.allocated, len(grid.freeChunks)
+        # Cells are written in a window that wanders around the field and most older ones are cleared, so chunks are left empty, released and used again.
+        corner = rng.integers(0, [size[0]-64, size[1]-64])
+        cells = rng.choice(64*64, rng.integers(1, 300), replace=False)
+        xs, ys = corner[0] + cells//64, corner[1] + cells%64
+        grid[xs, ys] = dense[xs, ys] = np.where(rng.random(len(cells)) < 0.9, rng.integers(0, 10_000, len(cells)), -1)
+        occupied = np.flatnonzero(dense != -1)
+        cleared = np.divmod(occupied[rng.random(len(occupied)) < 0.5], size[1])
+        grid[cleared] = dense[cleared] = -1
+        x, y = rng.integers(0, size[0]), rng.integers(0, size[1])
+        grid[x, y] = dense[x, y] = rng.integers(-1, 10)
+        assert grid[x, y] == dense[x, y]
+        if step % 10 == 0:
+            window = slice(*sorted(rng.integers(0, size[0], 2))), slice(*sorted(rng.integers(0, size[1], 2)))
+            grid[window] = dense[window] = -1
+            assert np.array_equal(grid[window], dense[window])
+            assert np.array_equal(grid[:, :], dense)
+        occupied = np.flatnonzero(dense != -1)
+        assert np.array_equal(grid.occupiedCells(), occupied) and np.array_equal(grid.flat[occupied], dense.flat[occupied])
+        released = released or grid.allocated < allocated
+        reused = reused or len(grid.freeChunks) < freeChunks
+    assert released and reused
+    copied = grid.copy()
+    grid.fill(-1)
+    assert not len(grid.occupiedCells()) and np.array_equal(copied[:, :], dense)
+
+
+def testChunkedGridReleasesEmptyChunks():
+    grid = ChunkedGrid(SIZE) # 26x20 chunks.
+    cells = np.arange(grid.size)
+    xs, ys = np.divmod(cells, SIZE[1])
+    first, second = xs < 80, xs >= 80 # The first 10 rows of chunks and the other 16.
+    grid[xs[first], ys[first]] = 1
+    grid[xs[first], ys[first]] = -1
+    assert grid.allocated == 200 # Not released until twice as many chunks are allocated as after the last release.
+    grid[xs[second], ys[second]] = 2
+    assert grid.allocated == 320 and len(grid.freeChunks) == 200
+    grid[xs[first], ys[first]] = 3
+    assert grid.allocated == 520 and grid.used == 521 # All released chunks were used again.
+    assert np.array_equal(grid[:, :], np.where(xs < 80, 3, 2).reshape(SIZE))
+
+
+def assertSameIndex(simulation):
+    indices = np.flatnonzero(simulation.alive)
+    cells = np.sort(simulation.cellIndex.toCells(simulation.positions[indices]))
+    assert np.array_equal(simulation.grid[simulation.positions[indices, 0], simulation.positions[indices, 1]], indices)
+    assert np.array_equal(simulation.grid.occupiedCells(), cells)
+    cellIndex = simulation.cellIndex
+    assert len(cellIndex) == len(indices) and np.array_equal(np.sort(cellIndex.cells[:cellIndex.count]), cells)
+    assert np.array_equal(cellIndex.slots.flat[cellIndex.cells[:cellIndex.count]], np.arange(cellIndex.count))
+
+
+def testSparseSimulation():
+    random.seed(4)
+    simulation = engine.Simulation([300, 200], population=400, generationLength=20, sparse=True)
+    for step in range(70):
+        simulation()
+        if step == 30:
+            simulation.removeAt(simulation.positions[np.flatnonzero(simulation.alive)[0]])
+        assertSameIndex(simulation)
+    assert simulation.generation == 3
+
+
+def testSampleFree():
+    rng = np.random.default_rng(2)
+    for occupiedShare in [0.1, 0.9]: # Drawing free cells at random and listing them.
+        cellIndex = SparseCellIndex(SIZE, rng.choice(SIZE[0]*SIZE[1], int(SIZE[0]*SIZE[1]*occupiedShare), replace=False))
+        occupied = cellIndex.cells[:cellIndex.count].copy()
+        sampled = cellIndex.sampleFree(500, rng)
+        assert len(sampled) == 500 and len(np.unique(sampled)) == 500
+        assert not np.isin(sampled, occupied).any() and not cellIndex.isOccupied(sampled).any()
+        assert len(cellIndex.sampleFree(cellIndex.free + 10, rng)) == cellIndex.free
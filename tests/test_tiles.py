@@ -0,0 +1,38 @@
+# Tests of stepping one simulation in tiles on worker processes
+import random
+import numpy as np
+import engine
+import tiles
+from profiling import profiler
+
+
+def createSimulation():
+    random.seed(3)
+    return engine.Simulation([60, 60], generationLength=30)
+
+
+def testSameAsSerial():
+    serial, tiled = createSimulation(), createSimulation()
+    with tiles.TiledStepper(tiled, 2) as stepper:
+        for _ in range(40):
+            serial()
+            stepper()
+    assert np.array_equal(serial.positions, tiled.positions) and np.array_equal(serial.speciesIDs, tiled.speciesIDs)
+
+
+def testTimings():
+    simulation = createSimulation()
+    records = []
+    simulation.listeners.append(lambda simulation, record: records.append(record))
+    profiler.enabled = True
+    profiler.reset()
+    try:
+        with tiles.TiledStepper(simulation, 1) as stepper:
+            for _ in range(30):
+                stepper()
+        stats = profiler.stats()
+    finally:
+        profiler.enabled = False
+        profiler.reset()
+    assert records[0]["thinkSeconds"] > 0 and records[0]["moveSeconds"] > 0
+    assert stats["think"]["calls"] == 30 and stats["move"]["calls"] == 30
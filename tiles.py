@@ -0,0 +1,210 @@
+################################################################
+# Steps one large simulation on several cores.
+# The field is split into tiles of columns, each stepped by a worker process. All arrays live in shared memory,
+# only their names and the tile bounds are sent to the workers. Run "python tiles.py --help" for a scaling report.
+################################################################
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+import argparse
+import hashlib
+import random
+import time
+import numpy as np
+import engine
+from profiling import profiler
+
+
+class SharedArrays:
+    """Numpy arrays backed by shared memory, a block is only re-created when the shape or type of its array changes."""
+    def __init__(self):
+        self.blocks: dict[str, shared_memory.SharedMemory] = {}
+        self.arrays: dict[str, np.ndarray] = {}
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def share(self, name, array):
+        """Copies "array" into the shared block called "name" and returns the shared view of it."""
+        array = np.asarray(array)
+        if (shared := self.arrays.get(name)) is None or shared.shape != array.shape or shared.dtype != array.dtype:
+            if name in self.blocks:
+                del self.arrays[name]
+                block = self.blocks.pop(name)
+                block.close()
+                block.unlink()
+            self.blocks[name] = block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.arrays[name] = shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        return shared
+
+    def layout(self):
+        return {name: (self.blocks[name].name, array.shape, array.dtype.str) for name, array in self.arrays.items()}
+
+    def close(self):
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+workerBlocks: dict[str, shared_memory.SharedMemory] = {}
+def attach(layout):
+    """Worker side of "SharedArrays", keeps blocks open between tasks since they are only re-created at new generations."""
+    blockNames = [blockName for blockName, _, _ in layout.values()]
+    for blockName in [blockName for blockName in workerBlocks if blockName not in blockNames]:
+        workerBlocks.pop(blockName).close()
+    arrays = {}
+    for name, (blockName, shape, dtype) in layout.items():
+        if (block := workerBlocks.get(blockName)) is None:
+            try:
+                block = shared_memory.SharedMemory(name=blockName, track=False)
+            except TypeError: # Python versions before 3.13 always register the block, with the resource tracker shared with the main process this does no harm.
+                block = shared_memory.SharedMemory(name=blockName)
+            workerBlocks[blockName] = block
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays
+
+
+def proposeTile(task):
+    """First phase, evaluates the brains of all organisms inside the tile and writes the cells they want to end up in."""
+    layout, (start, stop), fieldSize, brainType = task
+    arrays = attach(layout)
+    tile = arrays["grid"][start:stop]
+    indices = np.sort(tile[tile >= 0])
+    movements = brainType(arrays["weights"], fieldSize, arrays["species"][indices])(arrays["positions"][indices], arrays["directions"][indices], arrays["sensory"][indices], arrays["moves"][indices])
+    movements[~arrays["motivated"][indices]] = 0
+    arrays["movements"][indices] = movements
+    # Reading the grid outside of the tile is the exchange of boundary columns, nothing writes to the grid during this phase.
+    arrays["final"][indices] = engine.proposeMoves(arrays["grid"], arrays["positions"][indices], movements, [fieldSize[0]-1, fieldSize[1]-1])
+    return len(indices)
+
+
+def resolveTile(task):
+    """Second phase, decides which organism gets each cell of the tile. Claimants can only come from the tile and the columns right next to it."""
+    layout, (start, stop), fieldSize, _ = task
+    arrays = attach(layout)
+    halo = arrays["grid"][max(start-1, 0):min(stop+1, fieldSize[0])]
+    indices = np.sort(halo[halo >= 0])
+    final = arrays["final"][indices]
+    claims = (final[:, 0] >= start) & (final[:, 0] < stop)
+    indices, final = indices[claims], final[claims]
+    arrays["won"][indices] = engine.resolveClaims(indices, arrays["positions"][indices], final, fieldSize)
+    return len(indices)
+
+
+class TiledStepper:
+    """
+    Steps "simulation" in place using a pool of worker processes, calling it replaces "simulation()".
+    Random values are still drawn by the simulation itself and winners of contested cells only depend on organism indices,
+    so the result is the same as stepping serially, whatever the number of workers.
+    """
+    def __init__(self, simulation: engine.Simulation, workers=mp.cpu_count(), tilesPerWorker=2):
+        if not engine.USEBRAINS:
+            raise ValueError("Tiled stepping needs brains to be enabled!")
+        if simulation.sparse:
+            raise ValueError("Tiled stepping needs a dense field, a sparse one can't be shared with the workers!")
+        if simulation.recurrent:
+            raise ValueError("Tiled stepping doesn't support recurrent brains, their internal state isn't shared with the workers!")
+        self.simulation = simulation
+        self.workers = workers
+        tileCount = max(1, min(workers*tilesPerWorker, simulation.size[0]))
+        bounds = np.linspace(0, simulation.size[0], tileCount+1).astype(int)
+        self.tiles = [(int(bounds[i]), int(bounds[i+1])) for i in range(tileCount)]
+        self.shared = SharedArrays()
+        self.sharedBrain = None
+        resource_tracker.ensure_running() # Workers have to share the tracker of this process, otherwise they would clean up blocks they only attached to.
+        self.pool = mp.Pool(workers)
+
+    def __repr__(self):
+        return "TiledStepper with {} workers and {} tiles".format(self.workers, len(self.tiles))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __call__(self):
+        simulation = self.simulation
+        startTime = time.perf_counter()
+        randomness = simulation.frameRandomness()
+        # The simulation keeps working on the shared arrays, they are only copied again after a new generation replaced them.
+        for name in ["grid", "positions", "directions"]:
+            if getattr(simulation, name) is not self.shared.arrays.get(name):
+                setattr(simulation, name, self.shared.share(name, getattr(simulation, name)))
+        if simulation.populationBrain is not self.sharedBrain:
+            self.sharedBrain = simulation.populationBrain
+            self.shared.share("weights", simulation.populationBrain.weights)
+            self.shared.share("species", simulation.populationBrain.species)
+        for name, values in randomness.items():
+            self.shared.share(name, values)
+        for name, dtype in [("movements", np.int64), ("final", np.int64)]:
+            self.shared.share(name, np.zeros((len(simulation.organisms), 2), dtype=dtype))
+        self.shared.share("won", np.zeros(len(simulation.organisms), dtype=bool))
+
+        layout = self.shared.layout()
+        # Workers evaluate the shared weights with the same kind of brain as the simulation, "PopulationBrain" or "FixedPointBrain".
+        tasks = [(layout, tile, simulation.size, type(simulation.populationBrain)) for tile in self.tiles]
+        self.pool.map(proposeTile, tasks)
+        # Same phases as "Simulation.__call__": evaluating brains and proposing moves is thinking, resolving and applying them is moving.
+        thinkTime = time.perf_counter()
+        self.pool.map(resolveTile, tasks)
+
+        indices = np.flatnonzero(simulation.alive)
+        start = simulation.positions[indices]
+        simulation.applyMoves(indices, start, self.shared["final"][indices], self.shared["won"][indices])
+        simulation.directions[indices] = self.shared["movements"][indices]
+        moveTime = time.perf_counter()
+        simulation.timings["think"] += thinkTime-startTime
+        simulation.timings["move"] += moveTime-thinkTime
+        if profiler.enabled:
+            profiler.record("think", thinkTime-startTime)
+            profiler.record("move", moveTime-thinkTime)
+        simulation.advance()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        # Give the simulation its own arrays back before the shared memory is released.
+        for name in ["grid", "positions", "directions"]:
+            if getattr(self.simulation, name) is self.shared.arrays.get(name):
+                setattr(self.simulation, name, getattr(self.simulation, name).copy())
+        self.shared.close()
+
+
+def stateHash(simulation: engine.Simulation):
+    """Fingerprint of the positions and directions of all organisms, used to check that different worker counts give the same result."""
+    return hashlib.sha1(simulation.grid.tobytes() + simulation.positions.tobytes() + simulation.directions.tobytes()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports how tiled stepping of one simulation scales with the number of workers.")
+    parser.add_argument("--size", type=int, nargs=2, default=[1000, 1000], metavar=("X", "Y"))
+    parser.add_argument("--population", type=int, default=None, help="Size of the first generation, defaults to half the field.")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = []
+    for workers in [0] + args.workers: # 0 workers steps serially without a pool as reference.
+        random.seed(args.seed)
+        simulation = engine.Simulation(args.size, population=args.population, generationLength=args.steps+1)
+        stepper = TiledStepper(simulation, workers) if workers else simulation
+        startTime = time.perf_counter()
+        for _ in range(args.steps):
+            stepper()
+        duration = time.perf_counter()-startTime
+        if workers:
+            stepper.close()
+        results.append((workers, args.steps/duration, stateHash(simulation)))
+
+    serialRate, serialHash = results[0][1], results[0][2]
+    print("Workers  Steps/sec  Speedup  Same as serial")
+    for workers, rate, fingerprint in results:
+        print("{:>7}  {:>9.2f}  {:>7.2f}  {}".format(workers or "serial", rate, rate/serialRate, fingerprint == serialHash))
+
+
+if __name__ == "__main__":
+    main()